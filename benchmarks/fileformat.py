@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Format lookup benchmark of get_fileformat_from_filename
+
+Filenames of common extensions are looked up repeatedly with the legacy
+lookup (build a tuple of extension lists and scan it in every call) and with
+the current lookup (a dictionary built once from the extensions registered
+in Pillow).
+
+Usage::
+
+    $ python benchmarks/fileformat.py [--lookups=1000000]
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+import sys
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+FILENAMES = (
+    'img/thumbnails/photo.jpg',
+    'img/thumbnails/photo.small.png',
+    'img/thumbnails/photo.large.xpm',
+    'img/thumbnails/photo.tiny.webp',
+)
+
+
+def setup():
+    from django.conf import settings
+    settings.configure(INSTALLED_APPS=['thumbnailfield'])
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+
+
+def legacy_get_fileformat_from_filename(filename):
+    # emulate the previous lookup which scanned the tuple in every call
+    patterns = (
+        (['.png'], 'PNG'),
+        (['.jpg', '.jpe', '.jpeg'], 'JPEG'),
+        (['.gif'], 'GIF'),
+        (['.tif', '.tiff'], 'TIFF'),
+        (['.bmp', '.dib'], 'BMP'),
+        (['.dcx'], 'DCX'),
+        (['.eps', 'ps'], 'EPS'),
+        (['.im'], 'IM'),
+        (['.pcd'], 'PCD'),
+        (['.pcx'], 'PCX'),
+        (['.pdf'], 'PDF'),
+        (['.pbm', '.pgm', '.ppm'], 'PPM'),
+        (['.psd'], 'PSD'),
+        (['.xbm'], 'XBM'),
+        (['.xpm'], 'XPM')
+    )
+    if '.' not in filename:
+        return None
+    ext = os.path.splitext(filename)[1].lower()
+    for pattern in patterns:
+        if ext in pattern[0]:
+            return pattern[1]
+    return None
+
+
+def measure(lookup, lookups):
+    filenames = FILENAMES * (lookups // len(FILENAMES))
+    started = time.time()
+    for filename in filenames:
+        lookup(filename)
+    return time.time() - started
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--lookups', type='int', default=1000000)
+    opts, args = parser.parse_args()
+    setup()
+    from thumbnailfield.utils import get_fileformat_from_filename
+    sys.stdout.write('%d lookups\n' % opts.lookups)
+    sys.stdout.write('%-12s %12s %12s\n' % ('lookup', 'seconds',
+                                            'lookups/sec'))
+    for name, lookup in (('legacy', legacy_get_fileformat_from_filename),
+                         ('current', get_fileformat_from_filename)):
+        elapsed = measure(lookup, opts.lookups)
+        sys.stdout.write('%-12s %12.3f %12.0f\n' % (
+            name, elapsed, opts.lookups / elapsed))
+
+
+if __name__ == '__main__':
+    main()
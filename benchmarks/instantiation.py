@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Model instantiation benchmark of ThumbnailField
+
+Model instances with a ThumbnailField are created and the field file is
+accessed (as loading rows of a list view does) for the legacy field file
+(set accessor properties on the class in every instantiation) and for the
+current field file (dispatch accessors in __getattr__).
+
+Usage::
+
+    $ python benchmarks/instantiation.py [--rows=10000] [--patterns=5]
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+import sys
+import time
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+
+def setup():
+    from django.conf import settings
+    settings.configure(INSTALLED_APPS=['thumbnailfield'])
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+
+
+def create_model(name, attr_class, patterns):
+    from django.db import models
+    from thumbnailfield.fields import ThumbnailField
+
+    class Field(ThumbnailField):
+        pass
+    Field.attr_class = attr_class
+
+    attrs = {
+        '__module__': __name__,
+        'thumbnail': Field('thumbnail', upload_to='thumbnails',
+                           patterns=patterns),
+        'Meta': type('Meta', (), {'app_label': 'thumbnailfield'}),
+    }
+    return type(name, (models.Model,), attrs)
+
+
+def create_legacy_attr_class():
+    from thumbnailfield.fields import ThumbnailFieldFile
+
+    class LegacyThumbnailFieldFile(ThumbnailFieldFile):
+        # emulate the previous behavior which set accessor properties on the
+        # class in every instantiation
+        def __init__(self, *args, **kwargs):
+            super(LegacyThumbnailFieldFile, self).__init__(*args, **kwargs)
+            cls = LegacyThumbnailFieldFile
+            for name in self.patterns.iterkeys():
+                if name is None:
+                    continue
+                fget = lambda self, name=name: self._get_thumbnail_file(name)
+                setattr(cls, name, property(fget=fget))
+                fget = lambda self, name=name: self._get_thumbnail_file(
+                    name).file
+                setattr(cls, '%s_file' % name, property(fget=fget))
+                fget = lambda self, name=name: self._get_thumbnail_file(
+                    name).path
+                setattr(cls, '%s_path' % name, property(fget=fget))
+                fget = lambda self, name=name: self._get_thumbnail_url(name)
+                setattr(cls, '%s_url' % name, property(fget=fget))
+                fget = lambda self, name=name: self._get_thumbnail_file(
+                    name).size
+                setattr(cls, '%s_size' % name, property(fget=fget))
+    return LegacyThumbnailFieldFile
+
+
+def measure(model, rows):
+    started = time.time()
+    for i in range(rows):
+        instance = model(id=i, thumbnail='thumbnails/%d.png' % i)
+        instance.thumbnail
+    return time.time() - started
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--rows', type='int', default=10000)
+    parser.add_option('--patterns', type='int', default=5)
+    opts, args = parser.parse_args()
+    setup()
+    from thumbnailfield.fields import ThumbnailFieldFile
+    patterns = dict(('pattern%d' % i, (100 * (i + 1), 100 * (i + 1)))
+                    for i in range(opts.patterns))
+    models = (
+        ('legacy', create_model('LegacyEntry',
+                                create_legacy_attr_class(), patterns)),
+        ('current', create_model('CurrentEntry',
+                                 ThumbnailFieldFile, patterns)),
+    )
+    sys.stdout.write('%d rows, %d patterns\n' % (opts.rows, opts.patterns))
+    sys.stdout.write('%-12s %12s %12s\n' % ('field file', 'seconds',
+                                            'rows/sec'))
+    for name, model in models:
+        elapsed = measure(model, opts.rows)
+        sys.stdout.write('%-12s %12.3f %12.0f\n' % (
+            name, elapsed, opts.rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
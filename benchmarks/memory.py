@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Peak memory benchmark of thumbnail pipelines
+
+Each pattern is processed in a separate process and the increase of the peak
+RSS (ru_maxrss) from the decoded source image is reported for the legacy
+processing (copy the source and copy again in every process method) and for
+the current pipeline (copy elision).
+
+Usage::
+
+    $ python benchmarks/memory.py [--width=6000] [--height=4000]
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+import sys
+import resource
+import subprocess
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+PATTERNS = (
+    ('thumbnail', (160, 120)),
+    ('resize', ((640, 480, 'resize'),)),
+    ('crop', ((320, 240, 'crop', {'left': 0, 'upper': 0}),)),
+    ('grayscale+thumbnail', ((None, None, 'grayscale'), (320, 240))),
+    ('sepia+resize', ((None, None, 'sepia'), (800, 400, 'resize'))),
+    ('thumbnail+thumbnail', ((1600, 1200), (320, 240))),
+)
+
+
+def setup():
+    from django.conf import settings
+    settings.configure(INSTALLED_APPS=['thumbnailfield'])
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+
+
+def maxrss():
+    # ru_maxrss is KiB in Linux and bytes in Mac OS X
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return rss / 1024.0
+
+
+def legacy(pipeline, img):
+    # emulate the previous behavior which copied the image in every step
+    processed = img.copy()
+    for step in pipeline.steps:
+        copied = processed.copy()
+        processed = step.method(copied, step.width, step.height,
+                                **step.options)
+    return processed
+
+
+def run(name, mode, width, height):
+    setup()
+    from thumbnailfield.compatibility import Image
+    from thumbnailfield.pipelines import compile_patterns
+    patterns = dict(PATTERNS)[name]
+    pipeline = compile_patterns(patterns)
+    img = Image.new('RGBA', (width, height), (128, 64, 32, 255))
+    img.load()
+    baseline = maxrss()
+    if mode == 'legacy':
+        legacy(pipeline, img)
+    else:
+        pipeline(img)
+    sys.stdout.write('%.1f\n' % (maxrss() - baseline))
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--width', type='int', default=6000)
+    parser.add_option('--height', type='int', default=4000)
+    parser.add_option('--run', nargs=2, default=None)
+    opts, args = parser.parse_args()
+    if opts.run:
+        run(opts.run[0], opts.run[1], opts.width, opts.height)
+        return
+    sys.stdout.write('Source: %dx%d RGBA\n' % (opts.width, opts.height))
+    sys.stdout.write('%-24s %12s %12s\n' % (
+        'pattern', 'legacy (MB)', 'current (MB)'))
+    for name, patterns in PATTERNS:
+        results = []
+        for mode in ('legacy', 'current'):
+            output = subprocess.check_output([
+                sys.executable, __file__,
+                '--width=%d' % opts.width, '--height=%d' % opts.height,
+                '--run', name, mode,
+            ])
+            results.append(float(output.strip()))
+        sys.stdout.write('%-24s %12.1f %12.1f\n' % (
+            name, results[0], results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Upload throughput benchmark of ThumbnailField
+
+An encoded JPEG is saved to a ThumbnailField without the pattern of the
+original (``None``) repeatedly with the legacy save (decode, process with the
+empty pattern and re-encode the upload) and with the current save (stream the
+upload to the storage as it is).
+
+Usage::
+
+    $ python benchmarks/upload.py [--uploads=50] [--width=4000] [--height=3000]
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+
+def setup(media_root):
+    from django.conf import settings
+    settings.configure(INSTALLED_APPS=['thumbnailfield'],
+                       MEDIA_ROOT=media_root)
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+
+
+def create_field_file(attr_class):
+    from thumbnailfield.fields import ThumbnailField
+    field = ThumbnailField('thumbnail', upload_to='uploads',
+                           patterns={'large': (640, 480)})
+    field.name = field.attname = 'thumbnail'
+    # a stand-in of the model instance
+    instance = type('Instance', (object,), {})()
+    return attr_class(instance, field, None)
+
+
+def create_legacy_attr_class():
+    from thumbnailfield.fields import ThumbnailFieldFile
+    from thumbnailfield.utils import get_spooled_file
+    from thumbnailfield.utils import get_fileformat_from_filename
+    from django.db.models.fields.files import ImageFieldFile
+
+    class LegacyThumbnailFieldFile(ThumbnailFieldFile):
+        # emulate the previous behavior which always decoded and re-encoded
+        # the upload
+        def save(self, name, content, save=True):
+            processed = self._get_thumbnail(None)
+            file_fmt = get_fileformat_from_filename(name)
+            content = get_spooled_file(processed, file_fmt)
+            try:
+                ImageFieldFile.save(self, name, content, save=save)
+            finally:
+                content.close()
+    return LegacyThumbnailFieldFile
+
+
+def measure(attr_class, data, uploads):
+    from django.core.files.base import ContentFile
+    elapsed = 0
+    for i in range(uploads):
+        field_file = create_field_file(attr_class)
+        content = ContentFile(data)
+        field_file.file = content
+        field_file.name = 'upload.jpg'
+        field_file._committed = False
+        started = time.time()
+        field_file.save('upload.jpg', content, save=False)
+        elapsed += time.time() - started
+        field_file.storage.delete(field_file.name)
+    return elapsed
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--uploads', type='int', default=50)
+    parser.add_option('--width', type='int', default=4000)
+    parser.add_option('--height', type='int', default=3000)
+    opts, args = parser.parse_args()
+    media_root = tempfile.mkdtemp()
+    try:
+        setup(media_root)
+        from thumbnailfield.fields import ThumbnailFieldFile
+        from thumbnailfield.compatibility import Image
+        from thumbnailfield.compatibility import StringIO
+        buf = StringIO()
+        img = Image.new('RGB', (opts.width, opts.height), (128, 64, 32))
+        img.save(buf, format='JPEG', quality=90)
+        data = buf.getvalue()
+        sys.stdout.write('%d uploads of %dx%d JPEG (%d bytes)\n' % (
+            opts.uploads, opts.width, opts.height, len(data)))
+        sys.stdout.write('%-12s %12s %12s\n' % ('save', 'seconds',
+                                                'uploads/sec'))
+        for name, attr_class in (('legacy', create_legacy_attr_class()),
+                                 ('current', ThumbnailFieldFile)):
+            elapsed = measure(attr_class, data, opts.uploads)
+            sys.stdout.write('%-12s %12.3f %12.1f\n' % (
+                name, elapsed, opts.uploads / elapsed))
+    finally:
+        shutil.rmtree(media_root)
+
+
+if __name__ == '__main__':
+    main()
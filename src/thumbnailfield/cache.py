@@ -0,0 +1,185 @@
+# coding=utf-8
+"""
+Process-wide cache of decoded images
+
+Decoded PIL images (originals and thumbnails) are shared between
+ThumbnailFieldFile instances through an LRU cache with a byte-size budget
+(``THUMBNAILFIELD_IMAGE_CACHE_SIZE``). Cached images are shared thus they
+must not be modified.
+
+Concurrent decodes and renders of the same image are coalesced with a
+process-wide single-flight registry (see ``get_single_flight``).
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import threading
+from collections import OrderedDict
+
+from thumbnailfield.conf import settings
+
+
+def get_image_bytes(img):
+    """get approximate number of bytes used by the decoded PIL image
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> get_image_bytes(Image.new('L', (100, 100)))
+        10000
+        >>> get_image_bytes(Image.new('RGB', (100, 100)))
+        40000
+    """
+    # PIL stores multi-band images with 4 bytes per pixel
+    if img.mode in ('1', 'L', 'P'):
+        return img.size[0] * img.size[1]
+    return img.size[0] * img.size[1] * 4
+
+
+class ImageCache(object):
+
+    """LRU cache of decoded PIL images with a byte-size budget
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> cache = ImageCache(max_size=25000)
+        >>> cache.set(('a', 1), Image.new('L', (100, 100)))
+        >>> cache.set(('b', 1), Image.new('L', (100, 100)))
+        >>> cache.get(('a', 1)).size
+        (100, 100)
+        >>> cache.set(('c', 1), Image.new('L', (100, 100)))
+        >>> # ('b', 1) is the least recently used entry
+        >>> cache.get(('b', 1)) is None
+        True
+        >>> cache.size
+        20000
+        >>> # an image larger than the budget is not cached
+        >>> cache.set(('d', 1), Image.new('RGB', (100, 100)))
+        >>> cache.get(('d', 1)) is None
+        True
+        >>> cache.discard(lambda key: key[0] == 'a')
+        >>> cache.get(('a', 1)) is None
+        True
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            # move the entry to the end
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, img):
+        nbytes = get_image_bytes(img)
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_size:
+                return
+            self._entries[key] = (img, nbytes)
+            self.size += nbytes
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, predicate):
+        """remove entries which key satisfies predicate"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """get the process-wide image cache
+
+    The budget is configured with ``THUMBNAILFIELD_IMAGE_CACHE_SIZE`` (bytes)
+    """
+    global _cache
+    with _cache_lock:
+        max_size = settings.THUMBNAILFIELD_IMAGE_CACHE_SIZE
+        if _cache is None:
+            _cache = ImageCache(max_size)
+        elif _cache.max_size != max_size:
+            _cache.max_size = max_size
+            _cache.clear()
+        return _cache
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    """Registry which coalesces concurrent calls with the same key
+
+    The first caller of the key calls the function and the others wait for
+    and share its result (or its exception) instead of calling the function
+    again.
+
+    Usage::
+        >>> flight = SingleFlight()
+        >>> flight.do(('a', 1), lambda: 'result')
+        'result'
+        >>> len(flight)
+        0
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, fn, *args, **kwargs):
+        """call fn with args and kwargs or wait the same call in flight"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn(*args, **kwargs)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight():
+    """get the process-wide single-flight registry"""
+    return _single_flight
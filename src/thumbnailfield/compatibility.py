@@ -3,14 +3,17 @@
 Compatibility module
 """
 __author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
 
 # PIL image
 try:
    from PIL import Image 
    from PIL import ImageOps
+   from PIL import ImageChops
 except ImportError:
     import Image
     import ImageOps
+    import ImageChops
 
 # StringIO
 try:
@@ -31,3 +34,83 @@ try:
     from django.utils.text import ugettext_lazy as _
 except ImportError:
     from django.utils.translation import gettext_lazy as _
+
+# Django >= 1.7
+try:
+    from django.utils.module_loading import import_string
+except ImportError:
+    try:
+        from django.utils.module_loading import import_by_path as import_string
+    except ImportError:
+        from django.utils.importlib import import_module
+
+        def import_string(dotted_path):
+            module_path, class_name = dotted_path.rsplit('.', 1)
+            return getattr(import_module(module_path), class_name)
+
+# Django >= 1.7
+try:
+    from django.core.cache import caches
+
+    def get_cache(alias):
+        return caches[alias]
+except ImportError:
+    from django.core.cache import get_cache
+
+# Django >= 1.7
+try:
+    from django.apps import apps
+    get_model = apps.get_model
+except ImportError:
+    from django.db.models import get_model
+
+# Django >= 1.5
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # HttpResponse accepts an iterator as the content
+    from django.http import HttpResponse as StreamingHttpResponse
+
+# Django >= 1.4
+try:
+    from django.views.decorators.http import require_safe
+except ImportError:
+    from django.views.decorators.http import require_http_methods
+    require_safe = require_http_methods(['GET', 'HEAD'])
+
+# Django >= 1.3
+try:
+    from django.utils.http import parse_http_date_safe
+except ImportError:
+    import calendar
+    from email.utils import parsedate
+
+    def parse_http_date_safe(date):
+        try:
+            return calendar.timegm(parsedate(date))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+# Django >= 1.10
+try:
+    from django.urls import reverse
+except ImportError:
+    from django.core.urlresolvers import reverse
+
+# concurrent.futures ('futures' package is required in Python 2)
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None
+
+# Python >= 3.3 (os.rename replaces the file atomically in POSIX)
+replace = getattr(os, 'replace', os.rename)
+
+# Django >= 1.8 (Django < 1.4 does not have the signal)
+try:
+    from django.core.signals import setting_changed
+except ImportError:
+    try:
+        from django.test.signals import setting_changed
+    except ImportError:
+        setting_changed = None
@@ -23,6 +23,31 @@ class ThumbnailFieldConf(AppConf):
     DEFAULT_PROCESS_METHOD = 'thumbnail'
     DEFAULT_PROCESS_OPTIONS = {'resample': Image.ANTIALIAS}
     FILENAME_PATTERN = r'%(root)s/%(filename)s.%(name)s.%(ext)s'
+    EXTENSION_FORMATS = {}
     PROCESS_METHOD_TABLE = DEFAULT_PROCESS_METHOD_TABLE
 
     DEFAULT_PIL_SAVE_OPTIONS = {}
+    FORMAT_PIL_SAVE_OPTIONS = {
+        'WEBP': {'quality': 80, 'method': 4},
+        'AVIF': {'quality': 60, 'speed': 6},
+    }
+    SPOOL_MAX_SIZE = 2 * 1024 * 1024
+    IMAGE_CACHE_SIZE = 128 * 1024 * 1024
+
+    EXISTENCE_INDEX = None
+    EXISTENCE_INDEX_OPTIONS = {}
+
+    ATOMIC_WRITE = True
+    LOCK = None
+    LOCK_OPTIONS = {}
+
+    QUEUE = 'thumbnailfield.queues.ThreadPoolQueue'
+    QUEUE_OPTIONS = {}
+    PLACEHOLDER_URL = None
+
+    SERVE_MAX_AGE = 86400
+    RENDITION_STORE = 'thumbnailfield.renditions.LocMemRenditionStore'
+    RENDITION_STORE_OPTIONS = {}
+
+    USE_PROCESS_POOL = False
+    PROCESS_POOL_WORKERS = None
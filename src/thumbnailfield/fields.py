@@ -3,17 +3,44 @@
 Model fields of ThumbnailField
 """
 __author__ = 'Alisue <lambdalisue@hashnote.net>'
+import json
+import threading
+from django.core.files.base import File
+from django.core.files.base import ContentFile
 from django.db.models.fields.files import ImageField
 from django.db.models.fields.files import ImageFieldFile
 from django.db.models.fields.files import ImageFileDescriptor
 
 from thumbnailfield.conf import settings
 from thumbnailfield.utils import save_to_storage
-from thumbnailfield.utils import get_content_file
+from thumbnailfield.utils import save_content_to_storage
+from thumbnailfield.utils import copy_in_storage
+from thumbnailfield.utils import get_spooled_file
 from thumbnailfield.utils import get_thumbnail_filename
+from thumbnailfield.utils import get_pattern_fingerprint
 from thumbnailfield.utils import get_fileformat_from_filename
+from thumbnailfield.utils import get_format_extension
+from thumbnailfield.utils import get_format_mimetype
+from thumbnailfield.utils import get_accepted_mimetypes
+from thumbnailfield.utils import get_pil_save_options
 from thumbnailfield.utils import get_processed_image
+from thumbnailfield.utils import get_processed_images
+from thumbnailfield.utils import get_draft_size
+from thumbnailfield.utils import get_storage_key
+from thumbnailfield.utils import get_modified_time
+from thumbnailfield.cache import get_image_cache
+from thumbnailfield.cache import get_single_flight
+from thumbnailfield.pipelines import compile_patterns
+from thumbnailfield.pipelines import expand_ladders
+from thumbnailfield.pipelines import expand_formats
+from thumbnailfield.indexes import get_existence_index
+from thumbnailfield.queues import get_queue
+from thumbnailfield.locks import get_lock
+from thumbnailfield.probe import get_image_info
+from thumbnailfield.parallel import render_thumbnails
+from thumbnailfield.parallel import get_process_pool
 from thumbnailfield.compatibility import (Image, _)
+from thumbnailfield.compatibility import reverse
 
 
 class ThumbnailFileDescriptor(ImageFileDescriptor):
@@ -40,26 +67,84 @@ class ThumbnailFileDescriptor(ImageFileDescriptor):
             if previous_file and isinstance(previous_file, ThumbnailFieldFile):
                 current_file = getattr(instance, self.field.attname)
                 if previous_file != current_file:
+                    if self.field.manifest_field:
+                        # the manifest belongs to the previous file
+                        setattr(instance, self.field.manifest_field, '')
+                    index = get_existence_index()
                     for f in previous_files:
                         self.field.storage.delete(f)
+                        if index:
+                            index.discard(self.field.storage, f)
         else:
             super(ThumbnailFileDescriptor, self).__set__(instance, value)
 
 
+class ThumbnailImageFieldFile(ImageFieldFile):
+
+    """ImageFieldFile of thumbnail
+
+    The size is answered from ``_size_cache`` (and the dimensions from
+    ``_dimensions_cache``) without I/O when they are known (e.g. from the
+    manifest of ThumbnailFieldFile)
+    """
+
+    @property
+    def size(self):
+        size = getattr(self, '_size_cache', None)
+        if size is not None:
+            return size
+        return super(ThumbnailImageFieldFile, self).size
+
+
+# serialize read-modify-write of manifests in this process
+_manifest_lock = threading.Lock()
+
+
+# accessors of thumbnails dispatched by ThumbnailFieldFile.__getattr__ with
+# '<name>_<suffix>' attribute
+_THUMBNAIL_ACCESSORS = {
+    'file': lambda self, name: self._get_thumbnail_file(name).file,
+    'path': lambda self, name: self._get_thumbnail_file(name).path,
+    'url': lambda self, name: self._get_thumbnail_url(name),
+    'size': lambda self, name: self._get_thumbnail_file(name).size,
+    'serve_url': lambda self, name: self.get_serve_url(name),
+}
+
+
 class ThumbnailFieldFile(ImageFieldFile):
 
     """Enhanced ImageFieldFile
 
     This FieldFile contains thumbnail ImageFieldFile instances
-    and these thumbnails are automatically generate when accessed
+    and these thumbnails are automatically generate when accessed.
+    Thumbnails are accessed with the name of patterns (e.g. ``large``) and
+    shortcuts ``<name>_file``, ``<name>_path``, ``<name>_url``,
+    ``<name>_size`` and ``<name>_serve_url`` (see __getattr__)
 
     Attributes:
         _get_thumbnail_filename -- get thumbnail filename
+        _thumbnail_exists -- return True if the thumbnail file exists
+        _get_image_info -- get format and dimensions from the headers
+        _get_manifest -- get the manifest of thumbnails
+        _get_manifest_entry -- get the manifest entry of thumbnail
+        _update_manifest -- update the manifest entry of thumbnail
+        _get_image_cache_key -- get a key of the process-wide image cache
         _get_image -- get PIL image instance
+        _get_draft_image -- get PIL image instance decoded for patterns
         _get_thumbnail -- get PIL image instance of thumbnail
         _get_thumbnail_file -- get ImageFieldFile instance of thumbnail
+        _get_thumbnail_url -- get URL of thumbnail (or placeholder URL)
         _create_thumbnail -- create PIL image instance of thumbnail
+        _create_thumbnails -- create PIL image instances of thumbnails at once
+        _render_thumbnails -- render encoded thumbnails in executor
         _create_thumbnail_file -- create ImageFieldFile instance of thumbnail
+        _save_thumbnail_file -- save PIL image instance of thumbnail and
+                                return ImageFieldFile instance
+        _is_identity -- return True if the thumbnail is identical to the
+                        image of this field file
+        _copy_thumbnail_file -- copy this field file as the thumbnail
+        _is_oversized -- return True if the rung of width ladder is not
+                         smaller than this field file
         _update_thumbnail_file -- update thumbnail file and return
                                   ImageFieldFile instance
         _remove_thumbnail_file -- remove thumbanil file from storage
@@ -70,6 +155,11 @@ class ThumbnailFieldFile(ImageFieldFile):
         iter_thumbnail_files -- return iterator of thumbnail file
         get_thumbnail_files -- return list of thumbnail file
         update_thumbnail_files -- update thumbnail files in storage
+        get_serve_url -- get URL of thumbnail served by the view
+        get_rendition_url -- get URL of signed ad-hoc rendition
+        get_variant_name -- get pattern name of the best output format
+        get_variant_url -- get URL of thumbnail in the best output format
+        srcset -- get ``srcset`` attribute value of width ladder
         remove_thumbnail_files -- remove thumbnail files from storage
 
     """
@@ -78,63 +168,348 @@ class ThumbnailFieldFile(ImageFieldFile):
         """Constructor"""
         super(ThumbnailFieldFile, self).__init__(*args, **kwargs)
         self.patterns = self.field.patterns
+        self.pipelines = self.field.pipelines
         self.pil_save_options = self.field.pil_save_options
 
-        # create access properties
-        for name in self.patterns.iterkeys():
-            if name is None:
-                # None is for original file thus continue
-                continue
-            fget = lambda self, name = name: self._get_thumbnail_file(name)
-            setattr(ThumbnailFieldFile, name, property(fget=fget))
-            fget = lambda self, name = name: self._get_thumbnail_file(
-                name).file
-            setattr(ThumbnailFieldFile, '%s_file' % name, property(fget=fget))
-            fget = lambda self, name = name: self._get_thumbnail_file(
-                name).path
-            setattr(ThumbnailFieldFile, '%s_path' % name, property(fget=fget))
-            fget = lambda self, name = name: self._get_thumbnail_file(name).url
-            setattr(ThumbnailFieldFile, '%s_url' % name, property(fget=fget))
-            fget = lambda self, name = name: self._get_thumbnail_file(
-                name).size
-            setattr(ThumbnailFieldFile, '%s_size' % name, property(fget=fget))
+    def __getattr__(self, attr):
+        """dispatch thumbnail accessors (e.g. ``large`` or ``large_url``)
+
+        Accessors are resolved from ``patterns`` of the field when the
+        attribute is not found in the usual way thus nothing is added to the
+        class for each instance
+        """
+        # private attributes (and attributes looked up before __init__ or
+        # while unpickling) are never thumbnail accessors
+        patterns = self.__dict__.get('patterns')
+        if attr.startswith('_') or not patterns:
+            raise AttributeError(attr)
+        if attr in patterns:
+            return self._get_thumbnail_file(attr)
+        for suffix, accessor in _THUMBNAIL_ACCESSORS.items():
+            if attr.endswith('_' + suffix):
+                name = attr[:-len(suffix) - 1]
+                if name and name in patterns:
+                    return accessor(self, name)
+        raise AttributeError(attr)
+
+    def _get_image_info(self):
+        """get ImageInfo (format, width, height) of this field file
+
+        The info is read from the headers without decoding the image (see
+        probe.get_image_info). It returns None when the format is not
+        supported by the probe.
+        """
+        if not hasattr(self, '_image_info_cache'):
+            if getattr(self, '_file', None) is None or self.closed:
+                # read the headers from a new file object thus the file of
+                # this field file is not opened for the probe
+                fileobj = self.storage.open(self.name, 'rb')
+                try:
+                    self._image_info_cache = get_image_info(fileobj)
+                finally:
+                    fileobj.close()
+            else:
+                self.seek(0)
+                self._image_info_cache = get_image_info(self.file)
+        return self._image_info_cache
+
+    def _get_image_dimensions(self):
+        # used by width, height and width_field/height_field of the field
+        if not hasattr(self, '_dimensions_cache'):
+            info = self._get_image_info()
+            if info is None:
+                return super(ThumbnailFieldFile, self)._get_image_dimensions()
+            self._dimensions_cache = (info.width, info.height)
+        return self._dimensions_cache
+
+    @property
+    def image_format(self):
+        """PIL format name of this field file (e.g. 'JPEG') or None"""
+        info = self._get_image_info()
+        return info and info.format
 
     def _get_thumbnail_filename(self, name):
         """get thumbnail filename with name
 
         thumbnail filename is generated with utils.get_thumbnail_filename
-        method. original path is path of this field file
+        method. original path is path of this field file and the fingerprint
+        of the patterns is used as ``hash``
+        """
+        file_fmt = self.field.pattern_formats.get(name)
+        if file_fmt is None and not get_fileformat_from_filename(self.name):
+            # the extension of this field file is missing or unknown
+            file_fmt = self.image_format
+        return get_thumbnail_filename(
+            self.name, name, fingerprint=self._get_pattern_fingerprint(name),
+            ext=file_fmt and get_format_extension(file_fmt))
+
+    def _get_pattern_fingerprint(self, name):
+        """get the fingerprint of the named patterns"""
+        pipeline = self.pipelines[name]
+        if pipeline is None:
+            return get_pattern_fingerprint(None)
+        return pipeline.fingerprint
+
+    def _get_manifest(self):
+        """get the manifest of thumbnails of this field file
+
+        The manifest is a JSON object stored in ``manifest_field`` of the
+        model (see ThumbnailField) and it records the stored name, the
+        dimensions, the byte size, the format and the fingerprint of each
+        generated thumbnail::
+
+            {"source": <name of this field file>,
+             "thumbnails": {<name>: {"name": ..., "width": ..., "height": ...,
+                                     "size": ..., "format": ...,
+                                     "fingerprint": ...}}}
+
+        An empty dictionary is returned when ``manifest_field`` is not
+        specified or the manifest belongs to the other file.
+        """
+        field_name = self.field.manifest_field
+        if not field_name or self.instance is None:
+            return {}
+        raw = getattr(self.instance, field_name, None) or ''
+        cache = getattr(self, '_manifest_cache', None)
+        if cache is None or cache[0] != raw:
+            cache = (raw, self._parse_manifest(raw))
+            self._manifest_cache = cache
+        return cache[1]
+
+    def _parse_manifest(self, raw):
+        """parse the raw manifest and return it when it is of this file"""
+        try:
+            manifest = json.loads(raw) if raw else {}
+        except ValueError:
+            manifest = {}
+        if not isinstance(manifest, dict) or \
+                manifest.get('source') != self.name:
+            manifest = {}
+        return manifest
+
+    def _merge_manifest(self, manifest, name, entry):
+        """return the raw manifest with the entry or None if unchanged"""
+        thumbnails = dict(manifest.get('thumbnails', {}))
+        if entry is None:
+            if name not in thumbnails:
+                return None
+            del thumbnails[name]
+        else:
+            thumbnails[name] = entry
+        return json.dumps({'source': self.name, 'thumbnails': thumbnails},
+                          sort_keys=True)
+
+    def _get_manifest_entry(self, name):
+        """get the manifest entry of the named thumbnail or None
+
+        The entry is ignored when the patterns have changed since the
+        thumbnail was generated.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        entry = self._get_manifest().get('thumbnails', {}).get(name)
+        if entry and entry.get('fingerprint') == \
+                self._get_pattern_fingerprint(name):
+            return entry
+        return None
+
+    def _update_manifest(self, name, entry):
+        """update (or remove when entry is None) the manifest entry
+
+        The manifest is stored to the model instance and to the database
+        (with a single UPDATE query of the column) when the instance has been
+        saved. The UPDATE query only matches the manifest which has been read
+        thus the entry is merged with the current manifest in the database
+        and written again when another process has updated the manifest.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+            entry -- A dictionary of the manifest entry or None
+        """
+        field_name = self.field.manifest_field
+        if not field_name or self.instance is None:
+            return
+        with _manifest_lock:
+            current = getattr(self.instance, field_name, None)
+            raw = self._merge_manifest(self._get_manifest(), name, entry)
+            if raw is None:
+                return
+            if self.instance.pk is not None:
+                manager = type(self.instance)._default_manager
+                queryset = manager.filter(pk=self.instance.pk)
+                while not queryset.filter(**{field_name: current}).update(
+                        **{field_name: raw}):
+                    # the manifest has been updated by another process
+                    values = list(queryset.values_list(field_name, flat=True))
+                    if not values:
+                        # the instance has been deleted
+                        break
+                    current = values[0]
+                    raw = self._merge_manifest(
+                        self._parse_manifest(current or ''), name, entry)
+                    if raw is None:
+                        raw = current
+                        break
+            setattr(self.instance, field_name, raw)
+
+    def _get_manifest_file(self, name, entry):
+        """get ThumbnailImageFieldFile of the manifest entry
+
+        The dimensions and the size of the file are answered from the entry
+        without I/O.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+            entry -- A dictionary of the manifest entry
         """
-        return get_thumbnail_filename(self.name, name)
+        thumbs_file = ThumbnailImageFieldFile(self.instance,
+                                              self.field,
+                                              entry['name'])
+        thumbs_file._dimensions_cache = (entry['width'], entry['height'])
+        thumbs_file._size_cache = entry['size']
+        return thumbs_file
+
+    def _record_thumbnail_file(self, name, thumbs_filename, width, height,
+                               size, file_fmt):
+        """record the generated thumbnail to the manifest"""
+        self._update_manifest(name, {
+            'name': thumbs_filename,
+            'width': width,
+            'height': height,
+            'size': size,
+            'format': file_fmt,
+            'fingerprint': self._get_pattern_fingerprint(name),
+        })
+
+    def _thumbnail_exists(self, thumbs_filename):
+        """return True if the thumbnail file exists in storage
+
+        The existence index (settings.THUMBNAILFIELD_EXISTENCE_INDEX) is
+        checked first to avoid a storage round trip
+        """
+        index = get_existence_index()
+        if index:
+            return index.exists(self.storage, thumbs_filename)
+        return self.storage.exists(thumbs_filename)
+
+    def _get_image_cache_key(self, name=''):
+        """get a key of the process-wide image cache
+
+        The key consists of the storage, the name and the last modified time
+        of this field file and the fingerprint of the named patterns ('' for
+        the image of this field file). It returns None when this field file
+        has not been committed to the storage yet.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        if not self._committed:
+            return None
+        source_key = getattr(self, '_source_key_cache', None)
+        if source_key is None or source_key[1] != self.name:
+            source_key = (get_storage_key(self.storage), self.name,
+                          get_modified_time(self.storage, self.name))
+            self._source_key_cache = source_key
+        if name == '':
+            return source_key + ('',)
+        pipeline = self.pipelines[name]
+        return source_key + (pipeline and pipeline.fingerprint,)
 
     def _get_image(self):
         """get PIL image of this field file
 
-        PIL Image instance is cached in '_image_cache' attribute of this
-        instance
+        Decoded PIL Image instance is cached in the process-wide image cache
+        (see cache.get_image_cache) thus it must not be modified
         """
-        attr_name = '_image_cache'
-        if not getattr(self, attr_name, None):
-            self.seek(0)
-            setattr(self, attr_name, Image.open(self.file))
-        return getattr(self, attr_name)
+        key = self._get_image_cache_key()
+        img = key and get_image_cache().get(key)
+        if not img:
+            if key:
+                # concurrent decodes of the same file are coalesced
+                img = get_single_flight().do(key, self._decode_image, key)
+            else:
+                img = self._decode_image()
+        return img
+
+    def _decode_image(self, key=None):
+        """decode PIL image of this field file and store it in the cache
+
+        Attribute:
+            key -- A key of the process-wide image cache
+        """
+        self.seek(0)
+        img = Image.open(self.file)
+        img.load()
+        if key:
+            get_image_cache().set(key, img)
+        return img
+
+    def _get_draft_image(self, patterns):
+        """get PIL image of this field file decoded for patterns
+
+        JPEG decoder can scale the image down to 1/2, 1/4 or 1/8 while
+        decoding. When all patterns only scale the image, the image is
+        decoded in the smallest size which is still larger than any of
+        processed images. The drafted image is not cached because it cannot
+        be used for other patterns.
+
+        Attribute:
+            patterns -- A list of process patterns
+        """
+        key = self._get_image_cache_key()
+        if key and get_image_cache().get(key):
+            # the decoded image is already available
+            return self._get_image()
+        self.seek(0)
+        draft = Image.open(self.file)
+        if draft.format != 'JPEG':
+            return self._get_image()
+        size = get_draft_size(self, draft, patterns)
+        if size is None:
+            return self._get_image()
+        original_size = draft.size
+        draft.draft(draft.mode, size)
+        if draft.size == original_size:
+            return self._get_image()
+        draft.load()
+        return draft
 
     def _get_thumbnail(self, name, force=False):
         """get PIL thumbnail of this field file
 
-        PIL Image instance of thumbnail is cached in '_image_<name>_cache'
-        attribute of this instance. The instance is created by
-        '_create_thumbnail' method with
-        given named patterns
+        PIL Image instance of thumbnail is cached in the process-wide image
+        cache (see cache.get_image_cache). The instance is created by
+        '_create_thumbnail' method with given named patterns. Concurrent
+        renders of the same thumbnail in this process are coalesced into a
+        single render (see cache.get_single_flight)
 
         Attribute:
             name -- A name of thumbnail patterns
         """
-        attr_name = '_image_%s_cache' % name
-        if force or not getattr(self, attr_name, None):
-            patterns = self.patterns[name]
-            setattr(self, attr_name, self._create_thumbnail(patterns))
-        return getattr(self, attr_name)
+        key = self._get_image_cache_key(name)
+        thumbs = None
+        if not force and key:
+            thumbs = get_image_cache().get(key)
+        if not thumbs:
+            if key:
+                thumbs = get_single_flight().do(key, self._render_thumbnail,
+                                                name, key)
+            else:
+                thumbs = self._render_thumbnail(name)
+        return thumbs
+
+    def _render_thumbnail(self, name, key=None):
+        """create PIL thumbnail and store it in the cache
+
+        Attribute:
+            name -- A name of thumbnail patterns
+            key -- A key of the process-wide image cache
+        """
+        thumbs = self._create_thumbnail(self.pipelines[name])
+        if thumbs and key:
+            get_image_cache().set(key, thumbs)
+        return thumbs
 
     def _create_thumbnail(self, patterns):
         """create PIL thumbnail of this field file
@@ -142,12 +517,67 @@ class ThumbnailFieldFile(ImageFieldFile):
         Attribute:
             patterns -- A process patterns to generate thumbnail
         """
-        img = self._get_image()
+        img = self._get_draft_image([patterns])
         if img:
             thumb = get_processed_image(self, img, patterns)
             return thumb
         return None
 
+    def _create_thumbnails(self, names):
+        """create PIL thumbnails of this field file at once
+
+        The image of this field file is decoded only once and smaller
+        thumbnails are resampled from larger thumbnails (see
+        utils.get_processed_images)
+
+        Attribute:
+            names -- A list of names of thumbnail patterns
+        """
+        patterns = dict((name, self.pipelines[name]) for name in names)
+        img = self._get_draft_image(patterns.values())
+        if img:
+            return get_processed_images(self, img, patterns)
+        return {}
+
+    def _render_thumbnails(self, names, executor):
+        """render encoded thumbnails of this field file in executor
+
+        The encoded image of this field file and the patterns are handed to
+        parallel.render_thumbnails in the executor (e.g. ProcessPoolExecutor)
+        and a dictionary of name and ContentFile is returned.
+
+        Patterns which only scale the image are rendered together from a
+        single decode (smaller thumbnails are resampled from larger ones) and
+        each of the other patterns is rendered separately. All of them are
+        submitted before any result is waited thus they are rendered
+        concurrently.
+
+        Attribute:
+            names -- A list of names of thumbnail patterns
+            executor -- concurrent.futures.Executor instance
+        """
+        self.seek(0)
+        data = self.file.read()
+        scalables = {}
+        groups = [scalables]
+        for name in names:
+            file_fmt = get_fileformat_from_filename(
+                self._get_thumbnail_filename(name))
+            pipeline = self.pipelines[name]
+            if pipeline is not None and pipeline.scalable:
+                scalables[name] = (pipeline, file_fmt)
+            else:
+                groups.append({name: (pipeline, file_fmt)})
+        submitted = [executor.submit(render_thumbnails, data, patterns,
+                                     self.pil_save_options)
+                     for patterns in groups if patterns]
+        thumbnails = {}
+        for future in submitted:
+            rendered = future.result()
+            for name in rendered:
+                thumbnails[name] = ContentFile(rendered[name])
+        return thumbnails
+
     def _get_thumbnail_file(self, name, force=False):
         """get ImageFieldFile of thumbnail
 
@@ -167,26 +597,178 @@ class ThumbnailFieldFile(ImageFieldFile):
             setattr(self, attr_name, thumbs_file)
         return getattr(self, attr_name)
 
+    def _get_thumbnail_url(self, name):
+        """get URL of thumbnail
+
+        When ``asynchronous`` option of the field is True and the thumbnail
+        file does not exist yet, a job is enqueued to the queue
+        (settings.THUMBNAILFIELD_QUEUE) and the placeholder URL (or the URL of
+        this field file) is returned immediately.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        if not self.field.asynchronous or self._is_oversized(name):
+            return self._get_thumbnail_file(name).url
+        attr_name = '_thumbnail_file_%s_cache' % name
+        entry = self._get_manifest_entry(name)
+        if not getattr(self, attr_name, None) and entry:
+            setattr(self, attr_name, self._get_manifest_file(name, entry))
+        if not getattr(self, attr_name, None):
+            thumbs_filename = self._get_thumbnail_filename(name)
+            if not self._thumbnail_exists(thumbs_filename):
+                get_queue().enqueue(self, name)
+                return (self.field.placeholder_url or
+                        settings.THUMBNAILFIELD_PLACEHOLDER_URL or
+                        self.url)
+            thumbs_file = ImageFieldFile(self.instance,
+                                         self.field,
+                                         thumbs_filename)
+            setattr(self, attr_name, thumbs_file)
+        return getattr(self, attr_name).url
+
     def _get_or_create_thumbnail_file(self, name, force=False,
                                       pil_save_options=None):
         """get or create thumbnail file and return ImageFieldFile
 
+        This field file itself is returned for rungs of width ladders which
+        are not smaller than this field file (see _is_oversized)
+
         Attribute:
             name -- A name of thumbnail patterns
         """
+        if self._is_oversized(name):
+            return self
+        entry = None if force else self._get_manifest_entry(name)
+        if entry:
+            return self._get_manifest_file(name, entry)
         thumbs_filename = self._get_thumbnail_filename(name)
-        if force or not self.storage.exists(thumbs_filename):
-            thumbs = self._get_thumbnail(name, force)
-            if not thumbs:
-                return None
-            thumbs_filename = self._get_thumbnail_filename(name)
-            save_to_storage(thumbs, self.storage,
-                            thumbs_filename, **(pil_save_options or {}))
+        if force or not self._thumbnail_exists(thumbs_filename):
+            with get_lock()(self.storage, thumbs_filename):
+                # the thumbnail might be generated by another thread or
+                # process while waiting the lock
+                if force or not self._thumbnail_exists(thumbs_filename):
+                    if self._is_identity(name):
+                        return self._copy_thumbnail_file(name)
+                    thumbs = self._get_thumbnail(name, force)
+                    if not thumbs:
+                        return None
+                    return self._save_thumbnail_file(name, thumbs,
+                                                     pil_save_options)
+        thumbs_file = ImageFieldFile(self.instance,
+                                     self.field,
+                                     thumbs_filename)
+        return thumbs_file
+
+    def _save_thumbnail_file(self, name, thumbs, pil_save_options=None):
+        """save thumbnail to storage and return ImageFieldFile
+
+        The existing thumbnail file is always overwritten thus the filename
+        is deterministic. The file is replaced atomically when
+        settings.THUMBNAILFIELD_ATOMIC_WRITE is True and the storage is a
+        local file system.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+            thumbs -- PIL Image instance of thumbnail or File instance of
+                      the encoded thumbnail
+        """
+        thumbs_filename = self._get_thumbnail_filename(name)
+        file_fmt = get_fileformat_from_filename(thumbs_filename)
+        atomic = settings.THUMBNAILFIELD_ATOMIC_WRITE
+        if isinstance(thumbs, File):
+            content = thumbs
+            info = get_image_info(content)
+            size = info and (info.width, info.height)
+        else:
+            content = get_spooled_file(
+                thumbs, file_fmt,
+                **get_pil_save_options(file_fmt, pil_save_options))
+            size = thumbs.size
+        try:
+            thumbs_filename = save_content_to_storage(
+                content, self.storage, thumbs_filename,
+                overwrite=True, atomic=atomic)
+            if size:
+                self._record_thumbnail_file(name, thumbs_filename,
+                                            size[0], size[1], content.size,
+                                            file_fmt)
+        finally:
+            if content is not thumbs:
+                content.close()
+        index = get_existence_index()
+        if index:
+            index.add(self.storage, thumbs_filename)
         thumbs_file = ImageFieldFile(self.instance,
                                      self.field,
                                      thumbs_filename)
         return thumbs_file
 
+    def _is_identity(self, name):
+        """return True if the thumbnail is identical to this field file
+
+        The thumbnail is identical when this field file has been committed,
+        the format of the thumbnail is the same and the patterns do not
+        change the image (see pipelines.Pipeline.is_identity). The format and
+        the size are read from the headers without decoding the image.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        if not self._committed:
+            return False
+        info = self._get_image_info()
+        if info is None:
+            return False
+        file_fmt = get_fileformat_from_filename(
+            self._get_thumbnail_filename(name))
+        if file_fmt != info.format:
+            return False
+        pipeline = self.pipelines[name]
+        return pipeline is None or pipeline.is_identity(
+            (info.width, info.height))
+
+    def _copy_thumbnail_file(self, name):
+        """copy this field file as the thumbnail and return ImageFieldFile
+
+        The stored bytes are copied (or hard linked) in the storage without
+        decoding and encoding (see utils.copy_in_storage)
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        thumbs_filename = copy_in_storage(
+            self.storage, self.name, self._get_thumbnail_filename(name),
+            atomic=settings.THUMBNAILFIELD_ATOMIC_WRITE)
+        if self.field.manifest_field:
+            info = self._get_image_info()
+            self._record_thumbnail_file(name, thumbs_filename,
+                                        info.width, info.height, self.size,
+                                        info.format)
+        index = get_existence_index()
+        if index:
+            index.add(self.storage, thumbs_filename)
+        thumbs_file = ImageFieldFile(self.instance,
+                                     self.field,
+                                     thumbs_filename)
+        return thumbs_file
+
+    def _is_oversized(self, name):
+        """return True if the rung is not smaller than this field file
+
+        Such rungs of width ladders are never generated because they would
+        only be copies of this field file (see ThumbnailFieldFile.srcset)
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        width = self.field.ladder_widths.get(name)
+        if width is None:
+            return False
+        info = self._get_image_info()
+        source_width = info.width if info else self.width
+        return width >= source_width
+
     def _update_thumbnail_file(self, name):
         """update thumbnail file of storage
 
@@ -204,9 +786,22 @@ class ThumbnailFieldFile(ImageFieldFile):
         """
         attr_name = '_thumbnail_file_%s_cache' % name
         thumbs_file = getattr(self, attr_name, None)
+        entry = self._get_manifest_entry(name)
         if thumbs_file:
             thumbs_file.delete(save)
             delattr(self, attr_name)
+        elif entry:
+            # the thumbnail is known by the manifest
+            self.storage.delete(entry['name'])
+        if thumbs_file or entry:
+            index = get_existence_index()
+            if index:
+                # the stored name of the manifest might differ from the
+                # current filename of the pattern
+                index.discard(self.storage,
+                              entry['name'] if entry else
+                              self._get_thumbnail_filename(name))
+        self._update_manifest(name, None)
 
     def iter_pattern_names(self):
         """return iterator of thumbnail pattern names"""
@@ -218,9 +813,16 @@ class ThumbnailFieldFile(ImageFieldFile):
         return pattern_names
 
     def iter_thumbnail_filenames(self):
-        """return iterator of thumbnail filenames"""
+        """return iterator of thumbnail filenames
+
+        The stored names in the manifest are used when available
+        """
         for name in self.iter_pattern_names():
-            yield self._get_thumbnail_filename(name)
+            entry = self._get_manifest_entry(name)
+            if entry:
+                yield entry['name']
+            else:
+                yield self._get_thumbnail_filename(name)
 
     def get_thumbnail_filenames(self):
         """return list of thumbnail filenames"""
@@ -237,10 +839,172 @@ class ThumbnailFieldFile(ImageFieldFile):
         thumbnail_files = [f for f in self.iter_thumbnail_files()]
         return thumbnail_files
 
-    def update_thumbnail_files(self):
-        """update thumbanil files of storage"""
-        for name in self.iter_pattern_names():
-            self._update_thumbnail_file(name)
+    def update_thumbnail_files(self, executor=None, names=None):
+        """update thumbanil files of storage
+
+        All thumbnails are generated from a single decode of the original
+        image (see _create_thumbnails). Thumbnails identical to the original
+        are copied in the storage without rendering (see _is_identity)
+
+        Attribute:
+            executor -- concurrent.futures.Executor used to render thumbnails
+                        (default = the process pool when
+                        settings.THUMBNAILFIELD_USE_PROCESS_POOL is True)
+            names -- A list of names of thumbnail patterns to update
+                     (default = all pattern names)
+
+        Rungs of width ladders which are not smaller than this field file are
+        skipped (see _is_oversized)
+        """
+        if names is None:
+            names = self.get_pattern_names()
+        names = [name for name in names if not self._is_oversized(name)]
+        # thumbnails identical to the original are copied without rendering
+        rendered = []
+        for name in names:
+            if name is not None and self._is_identity(name):
+                thumbs_file = self._copy_thumbnail_file(name)
+                setattr(self, '_thumbnail_file_%s_cache' % name, thumbs_file)
+            else:
+                rendered.append(name)
+        names = rendered
+        if not names:
+            return
+        if executor is None and settings.THUMBNAILFIELD_USE_PROCESS_POOL:
+            executor = get_process_pool()
+        if executor is None:
+            thumbnails = self._create_thumbnails(names)
+        else:
+            thumbnails = self._render_thumbnails(names, executor)
+        for name in names:
+            thumbs = thumbnails.get(name)
+            if not thumbs:
+                continue
+            key = self._get_image_cache_key(name)
+            if key and not isinstance(thumbs, File):
+                get_image_cache().set(key, thumbs)
+            thumbs_file = self._save_thumbnail_file(
+                name, thumbs, self.pil_save_options)
+            setattr(self, '_thumbnail_file_%s_cache' % name, thumbs_file)
+
+    def get_serve_url(self, name):
+        """get URL of the thumbnail served by views.serve_thumbnail
+
+        The thumbnail is not generated until the URL is requested thus the
+        URL is available without I/O (``thumbnailfield.urls`` have to be
+        included in the URLconf)
+
+        Attribute:
+            name -- A name of thumbnail patterns
+        """
+        opts = self.instance._meta
+        return reverse('thumbnailfield_serve', kwargs={
+            'app_label': opts.app_label,
+            'model_name': opts.object_name.lower(),
+            'field_name': self.field.name,
+            'pattern': name,
+            'source': self.name,
+        })
+
+    def get_rendition_url(self, width, height, method=None, **options):
+        """get URL of the signed ad-hoc rendition of this field file
+
+        The rendition is not declared in ``patterns``. The process is signed
+        into the URL and rendered by views.serve_rendition (see
+        renditions.get_rendition_url)
+
+        Attribute:
+            width -- A width passed to the process method
+            height -- A height passed to the process method
+            method -- A name of the process method
+            options -- Options of the process method
+        """
+        # django.core.signing is available in Django >= 1.4 thus renditions
+        # are imported only when they are used
+        from thumbnailfield.renditions import get_rendition_url
+        return get_rendition_url(self, width, height, method, options)
+
+    def get_variant_name(self, name, accept=None):
+        """get pattern name of the best output format for Accept header
+
+        The first format in ``formats`` of the pattern whose mimetype is
+        explicitly accepted is chosen. The name itself (the format of this
+        field file) is returned when none of them is accepted.
+
+        Attribute:
+            name -- A name of thumbnail patterns
+            accept -- A value of Accept header of the request
+        """
+        variants = self.field.variants.get(name)
+        if not variants or not accept:
+            return name
+        accepted = get_accepted_mimetypes(accept)
+        for file_fmt, variant_name in variants:
+            if get_format_mimetype(file_fmt) in accepted:
+                return variant_name
+        return name
+
+    def get_variant_url(self, name, accept=None):
+        """get URL of the thumbnail in the best output format for Accept
+        header (see get_variant_name)
+
+        Attribute:
+            name -- A name of thumbnail patterns
+            accept -- A value of Accept header of the request
+        """
+        return self._get_thumbnail_url(self.get_variant_name(name, accept))
+
+    def srcset(self, name, accept=None):
+        """get ``srcset`` attribute value of the width ladder of name
+
+        Missing rungs are generated at once from a single decode of this
+        field file (see update_thumbnail_files) or enqueued when the field is
+        ``asynchronous``. Rungs which are not smaller than this field file
+        are skipped and this field file is listed with its width instead.
+
+        Attribute:
+            name -- A name of width ladder in patterns
+            accept -- A value of Accept header of the request used to choose
+                      the output format of rungs (see get_variant_name)
+        """
+        info = self._get_image_info()
+        source_width = info.width if info else self.width
+        rungs = [(width, self.get_variant_name(rung_name, accept))
+                 for width, rung_name in self.field.ladders[name]
+                 if width < source_width]
+        missing = []
+        for width, rung_name in rungs:
+            attr_name = '_thumbnail_file_%s_cache' % rung_name
+            if getattr(self, attr_name, None):
+                continue
+            entry = self._get_manifest_entry(rung_name)
+            if entry:
+                setattr(self, attr_name,
+                        self._get_manifest_file(rung_name, entry))
+                continue
+            thumbs_filename = self._get_thumbnail_filename(rung_name)
+            if self._thumbnail_exists(thumbs_filename):
+                setattr(self, attr_name, ImageFieldFile(self.instance,
+                                                        self.field,
+                                                        thumbs_filename))
+            else:
+                missing.append(rung_name)
+        if missing and self.field.asynchronous:
+            # missing rungs are omitted until they are generated
+            for rung_name in missing:
+                get_queue().enqueue(self, rung_name)
+        elif missing:
+            self.update_thumbnail_files(names=missing)
+        candidates = []
+        for width, rung_name in rungs:
+            thumbs_file = getattr(self,
+                                  '_thumbnail_file_%s_cache' % rung_name,
+                                  None)
+            if thumbs_file:
+                candidates.append('%s %dw' % (thumbs_file.url, width))
+        if not candidates or len(rungs) < len(self.field.ladders[name]):
+            candidates.append('%s %dw' % (self.url, source_width))
+        return ', '.join(candidates)
 
     def remove_thumbnail_files(self, save=True):
         """remove thumbnail files from storage
@@ -254,15 +1018,36 @@ class ThumbnailFieldFile(ImageFieldFile):
             self.instance.save()
 
     def save(self, name, content, save=True):
-        if self and not self._committed and None in self.patterns:
+        """save content to storage
+
+        The content is decoded, processed with the pattern of the original
+        (``None``) and re-encoded only when the pattern has any process.
+        Otherwise the content is streamed to the storage as it is.
+        """
+        if hasattr(self, '_image_info_cache'):
+            del self._image_info_cache
+        pipeline = self.pipelines.get(None)
+        if self and not self._committed and pipeline and pipeline.steps:
             # Apply original image process
             processed = self._get_thumbnail(None)
-            file_fmt = get_fileformat_from_filename(name)
-            content = get_content_file(processed, file_fmt)
+            # the format is sniffed when the extension is missing or unknown
+            file_fmt = get_fileformat_from_filename(name) or self.image_format
+            content = get_spooled_file(processed, file_fmt)
+            try:
+                super(ThumbnailFieldFile, self).save(name, content, save=save)
+            finally:
+                content.close()
+            return
         super(ThumbnailFieldFile, self).save(name, content, save=save)
 
     def delete(self, save=True):
+        if hasattr(self, '_image_info_cache'):
+            del self._image_info_cache
         self.remove_thumbnail_files(save=False)
+        if self:
+            # release decoded images of this field file
+            source_key = (get_storage_key(self.storage), self.name)
+            get_image_cache().discard(lambda key: key[:2] == source_key)
         super(ThumbnailFieldFile, self).delete(save=save)
 
 
@@ -281,7 +1066,9 @@ class ThumbnailField(ImageField):
 
     def __init__(self, verbose_name=None, name=None, width_field=None,
                  height_field=None, patterns=None,
-                 pil_save_options=None, **kwargs):
+                 pil_save_options=None, asynchronous=False,
+                 placeholder_url=None, manifest_field=None, formats=None,
+                 **kwargs):
         """Constructor
 
         Patterns:
@@ -318,17 +1105,79 @@ class ThumbnailField(ImageField):
             method.  for example, ``crop`` method required ``left`` and
             ``upper`` options to process.
 
+            A width ladder for ``srcset`` is declared with a dictionary::
+
+                patterns = {
+                    <Name>: {
+                        'widths': [<width>, <width>, ...],
+                        'method': <method_name>,    # default = 'thumbnail'
+                        'options': <method_options>,
+                    },
+                }
+
+            Each width is expanded into a pattern named ``<Name>_<width>w``
+            (see pipelines.expand_ladders and ThumbnailFieldFile.srcset)
+
         pil_save_options:
             a dictionary which will be passed as a keyword argument list to
-            PIL image save method.
+            PIL image save method. Default options of the output format
+            (settings.THUMBNAILFIELD_FORMAT_PIL_SAVE_OPTIONS) are updated
+            with it.
+
+        asynchronous:
+            if True, accessing the URL of a missing thumbnail does not
+            generate the thumbnail. A job is enqueued to the queue
+            (settings.THUMBNAILFIELD_QUEUE) and ``placeholder_url`` (or the
+            URL of the original image when it is not specified) is returned.
+
+        placeholder_url:
+            a URL returned while the thumbnail is generated in background
+            (default = settings.THUMBNAILFIELD_PLACEHOLDER_URL)
+
+        manifest_field:
+            a name of TextField of the model which stores the manifest of
+            generated thumbnails (stored name, dimensions, byte size, format
+            and fingerprint of the patterns). Thumbnail accessors are
+            answered from the manifest without I/O when it is specified.
+
+        formats:
+            a dictionary of a name of patterns (or width ladder) and a list
+            of output formats in the order of preference (e.g.
+            ``{'large': ['AVIF', 'WEBP']}``). Each format is expanded into a
+            pattern named ``<Name>_<format>`` (e.g. ``large_webp``) and
+            formats which the Pillow build cannot save are ignored. The
+            thumbnail in the format of the original image is used when the
+            client does not accept any of them (see
+            ThumbnailFieldFile.get_variant_name)
         """
         patterns = patterns or {}
         if '' in patterns:
             patterns[None] = patterns['']
             del patterns['']
         patterns[None] = patterns.get(None, None)
+        # width ladders are expanded into a pattern of each width
+        patterns, self.ladders = expand_ladders(patterns)
+        # output formats are expanded into a pattern of each format
+        self.formats = formats or {}
+        patterns, self.variants = expand_formats(patterns, self.formats,
+                                                 self.ladders)
+        self.pattern_formats = dict((variant_name, file_fmt)
+                                    for variants in self.variants.itervalues()
+                                    for file_fmt, variant_name in variants)
+        self.ladder_widths = {}
+        for rungs in self.ladders.itervalues():
+            for width, rung_name in rungs:
+                self.ladder_widths[rung_name] = width
+                for _, variant_name in self.variants.get(rung_name, ()):
+                    self.ladder_widths[variant_name] = width
         self.patterns = patterns
+        # compile patterns once (misconfiguration is reported here)
+        self.pipelines = dict((name, compile_patterns(pattern, self))
+                              for name, pattern in patterns.iteritems())
         self.pil_save_options = pil_save_options or settings.THUMBNAILFIELD_DEFAULT_PIL_SAVE_OPTIONS
+        self.asynchronous = asynchronous
+        self.placeholder_url = placeholder_url
+        self.manifest_field = manifest_field
         super(ThumbnailField, self).__init__(
             verbose_name, name, width_field, height_field, **kwargs)
 
@@ -340,6 +1189,8 @@ try:
             [],
             {
                 'patterns': ['patterns', {}],
+                'manifest_field': ['manifest_field', {'default': None}],
+                'formats': ['formats', {'default': {}}],
             },
         )
     ]
@@ -0,0 +1,167 @@
+# coding=utf-8
+"""
+Existence index of thumbnail files
+
+An existence index remembers which thumbnail files exist in a storage so that
+ThumbnailFieldFile does not need to ask the storage (e.g. a HEAD request to
+S3) every time a thumbnail is accessed. Only existing files are remembered
+thus a missing entry simply falls back to ``storage.exists``.
+
+The index is configured with ``THUMBNAILFIELD_EXISTENCE_INDEX`` (a dotted
+path of the index class) and ``THUMBNAILFIELD_EXISTENCE_INDEX_OPTIONS`` (a
+dictionary passed to the constructor).
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import hashlib
+import threading
+from collections import OrderedDict
+
+from thumbnailfield.conf import settings
+from thumbnailfield.compatibility import import_string
+from thumbnailfield.compatibility import get_cache
+from thumbnailfield.utils import get_storage_key
+
+
+class BaseExistenceIndex(object):
+
+    """Base class of existence index
+
+    Subclasses have to implement ``get``, ``add`` and ``discard``.
+    """
+
+    def get_key(self, storage, name):
+        """get a key of the file in the storage"""
+        return '%s:%s' % (get_storage_key(storage), name)
+
+    def get(self, storage, name):
+        """return True if the file is known to exist"""
+        raise NotImplementedError
+
+    def add(self, storage, name):
+        """remember the file exists in the storage"""
+        raise NotImplementedError
+
+    def discard(self, storage, name):
+        """forget the file"""
+        raise NotImplementedError
+
+    def exists(self, storage, name):
+        """return True if the file exists in the storage
+
+        The storage is asked only when the file is not found in the index.
+        """
+        if self.get(storage, name):
+            return True
+        if storage.exists(name):
+            self.add(storage, name)
+            return True
+        return False
+
+
+class LocMemExistenceIndex(BaseExistenceIndex):
+
+    """In-process existence index with LRU eviction
+
+    Usage::
+        >>> from django.core.files.storage import FileSystemStorage
+        >>> storage = FileSystemStorage()
+        >>> index = LocMemExistenceIndex(max_entries=2)
+        >>> index.add(storage, 'a.png')
+        >>> index.add(storage, 'b.png')
+        >>> index.get(storage, 'a.png')
+        True
+        >>> index.add(storage, 'c.png')
+        >>> # 'b.png' is the least recently used entry
+        >>> index.get(storage, 'b.png')
+        False
+        >>> index.discard(storage, 'a.png')
+        >>> index.get(storage, 'a.png')
+        False
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, storage, name):
+        key = self.get_key(storage, name)
+        with self._lock:
+            if key not in self._entries:
+                return False
+            # move the entry to the end
+            self._entries[key] = self._entries.pop(key)
+            return True
+
+    def add(self, storage, name):
+        key = self.get_key(storage, name)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = True
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, storage, name):
+        key = self.get_key(storage, name)
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class CacheExistenceIndex(BaseExistenceIndex):
+
+    """Existence index stored in Django cache backend
+
+    The index is shared between processes when the cache backend is (e.g.
+    memcached or redis).
+    """
+
+    def __init__(self, cache='default', timeout=None,
+                 key_prefix='thumbnailfield.exists'):
+        self.cache = get_cache(cache)
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def get_key(self, storage, name):
+        key = super(CacheExistenceIndex, self).get_key(storage, name)
+        # memcached does not accept long keys or keys with spaces
+        return '%s:%s' % (self.key_prefix,
+                          hashlib.md5(key.encode('utf-8')).hexdigest())
+
+    def get(self, storage, name):
+        return bool(self.cache.get(self.get_key(storage, name)))
+
+    def add(self, storage, name):
+        key = self.get_key(storage, name)
+        if self.timeout is None:
+            self.cache.set(key, True)
+        else:
+            self.cache.set(key, True, self.timeout)
+
+    def discard(self, storage, name):
+        self.cache.delete(self.get_key(storage, name))
+
+
+_index_cache = {}
+
+
+def get_existence_index():
+    """get existence index configured in settings (or None)
+
+    Usage::
+        >>> from thumbnailfield.compatibility import override_settings
+        >>> get_existence_index() is None
+        True
+        >>> with override_settings(THUMBNAILFIELD_EXISTENCE_INDEX=(
+        ...         'thumbnailfield.indexes.LocMemExistenceIndex')):
+        ...     index = get_existence_index()
+        >>> isinstance(index, LocMemExistenceIndex)
+        True
+    """
+    path = settings.THUMBNAILFIELD_EXISTENCE_INDEX
+    if not path:
+        return None
+    options = settings.THUMBNAILFIELD_EXISTENCE_INDEX_OPTIONS
+    key = (path, repr(sorted(options.items())))
+    if key not in _index_cache:
+        _index_cache[key] = import_string(path)(**options)
+    return _index_cache[key]
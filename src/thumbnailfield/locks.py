@@ -0,0 +1,191 @@
+# coding=utf-8
+"""
+Thumbnail generation locks
+
+A lock is acquired while a missing thumbnail is generated so that concurrent
+requests (threads or processes) produce exactly one render and one write.
+The lock is configured with ``THUMBNAILFIELD_LOCK`` (a dotted path of the
+lock class) and ``THUMBNAILFIELD_LOCK_OPTIONS`` (a dictionary passed to the
+constructor).
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+from django.core.exceptions import ImproperlyConfigured
+
+from thumbnailfield.conf import settings
+from thumbnailfield.utils import get_storage_key
+from thumbnailfield.compatibility import import_string
+from thumbnailfield.compatibility import get_cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class BaseLock(object):
+
+    """Base class of thumbnail generation lock
+
+    Subclasses have to implement ``acquire`` and ``release``. ``acquire``
+    returns a token passed to ``release``.
+    """
+
+    def get_key(self, storage, name):
+        """get a key of the file in the storage"""
+        key = '%s:%s' % (get_storage_key(storage), name)
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def acquire(self, storage, name):
+        raise NotImplementedError
+
+    def release(self, storage, name, token):
+        raise NotImplementedError
+
+    def __call__(self, storage, name):
+        """return a context manager which holds the lock"""
+        return _LockContext(self, storage, name)
+
+
+class _LockContext(object):
+
+    def __init__(self, lock, storage, name):
+        self.lock = lock
+        self.storage = storage
+        self.name = name
+        self.token = None
+
+    def __enter__(self):
+        self.token = self.lock.acquire(self.storage, self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release(self.storage, self.name, self.token)
+
+
+class NullLock(BaseLock):
+
+    """Lock which does nothing"""
+
+    def acquire(self, storage, name):
+        return None
+
+    def release(self, storage, name, token):
+        pass
+
+
+class FileLock(BaseLock):
+
+    """Lock with ``fcntl.flock`` on a lock file in lock_dir
+
+    The lock works between threads and processes on the same host (or hosts
+    sharing lock_dir on a file system which supports flock).
+
+    Thumbnails are hashed into ``stripes`` lock files so the number of lock
+    files in lock_dir is bounded. Two thumbnails which share a stripe are
+    generated one by one but it never dead locks while the lock is not
+    nested.
+
+    Usage::
+        >>> from django.core.files.storage import FileSystemStorage
+        >>> storage = FileSystemStorage()
+        >>> lock = FileLock()
+        >>> with lock(storage, 'test.large.png'):
+        ...     pass
+    """
+
+    def __init__(self, lock_dir=None, stripes=1024):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                'FileLock requires fcntl which is not available on this '
+                'platform')
+        self.lock_dir = lock_dir or os.path.join(tempfile.gettempdir(),
+                                                 'thumbnailfield-locks')
+        if not os.path.exists(self.lock_dir):
+            try:
+                os.makedirs(self.lock_dir)
+            except OSError:
+                # the directory has been created by another process
+                pass
+        self.stripes = stripes
+
+    def get_path(self, storage, name):
+        """get a path of the lock file of the file in the storage"""
+        stripe = int(self.get_key(storage, name), 16) % self.stripes
+        return os.path.join(self.lock_dir, '%d.lock' % stripe)
+
+    def acquire(self, storage, name):
+        path = self.get_path(storage, name)
+        fo = open(path, 'a')
+        fcntl.flock(fo.fileno(), fcntl.LOCK_EX)
+        return fo
+
+    def release(self, storage, name, token):
+        fcntl.flock(token.fileno(), fcntl.LOCK_UN)
+        token.close()
+
+
+class CacheLock(BaseLock):
+
+    """Lock with ``add`` of Django cache backend
+
+    The lock works between hosts when the cache backend is shared (e.g.
+    memcached or redis). The lock expires after ``timeout`` seconds to
+    prevent dead locks when the process holding the lock has died.
+    """
+
+    def __init__(self, cache='default', timeout=60, interval=0.1,
+                 key_prefix='thumbnailfield.lock'):
+        self.cache = get_cache(cache)
+        self.timeout = timeout
+        self.interval = interval
+        self.key_prefix = key_prefix
+
+    def get_key(self, storage, name):
+        key = super(CacheLock, self).get_key(storage, name)
+        return '%s:%s' % (self.key_prefix, key)
+
+    def acquire(self, storage, name):
+        key = self.get_key(storage, name)
+        token = uuid.uuid4().hex
+        expires = time.time() + self.timeout
+        while not self.cache.add(key, token, self.timeout):
+            if time.time() > expires:
+                # the lock holder seems to be dead
+                self.cache.set(key, token, self.timeout)
+                break
+            time.sleep(self.interval)
+        return token
+
+    def release(self, storage, name, token):
+        key = self.get_key(storage, name)
+        if self.cache.get(key) == token:
+            self.cache.delete(key)
+
+
+_lock_cache = {}
+
+
+def get_lock():
+    """get lock configured in settings
+
+    FileLock is used when settings.THUMBNAILFIELD_LOCK is None and fcntl is
+    available, otherwise NullLock.
+
+    Usage::
+        >>> isinstance(get_lock(), (FileLock, NullLock))
+        True
+    """
+    path = settings.THUMBNAILFIELD_LOCK
+    if path is None:
+        path = ('thumbnailfield.locks.FileLock' if fcntl else
+                'thumbnailfield.locks.NullLock')
+    options = settings.THUMBNAILFIELD_LOCK_OPTIONS
+    key = (path, repr(sorted(options.items())))
+    if key not in _lock_cache:
+        _lock_cache[key] = import_string(path)(**options)
+    return _lock_cache[key]
@@ -0,0 +1,44 @@
+# coding=utf-8
+"""
+Process thumbnail generation jobs queued by DatabaseQueue
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import traceback
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+
+from thumbnailfield.models import ThumbnailJob
+from thumbnailfield.queues import DatabaseQueue
+from thumbnailfield.queues import get_queue
+
+
+class Command(NoArgsCommand):
+    help = 'Process thumbnail generation jobs queued by DatabaseQueue'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--limit', type='int', default=None,
+                    help='The maximum number of jobs to process'),
+    )
+
+    def handle_noargs(self, **options):
+        limit = options.get('limit')
+        verbosity = int(options.get('verbosity', 1))
+        queue = get_queue()
+        if not isinstance(queue, DatabaseQueue):
+            queue = DatabaseQueue()
+        # failed jobs are kept for inspection but never processed again
+        jobs = ThumbnailJob.objects.filter(failed=False).order_by('pk')
+        if limit:
+            jobs = jobs[:limit]
+        count = failed = 0
+        for job in jobs:
+            # a job which fails must not block the following jobs
+            try:
+                queue.process(job)
+            except Exception:
+                failed += 1
+                queue.fail(job, traceback.format_exc())
+                self.stderr.write('Failed to process job %s\n' % job.pk)
+            count += 1
+        if verbosity > 0:
+            self.stdout.write('%d job(s) processed, %d failed\n' % (
+                count, failed))
@@ -0,0 +1,183 @@
+# coding=utf-8
+"""
+Rebuild thumbnail files of ThumbnailField
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+import time
+from optparse import make_option
+from multiprocessing.pool import ThreadPool
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+
+from thumbnailfield.fields import ThumbnailField
+from thumbnailfield.compatibility import get_model
+from thumbnailfield.compatibility import futures
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName.field_name>'
+    help = 'Rebuild thumbnail files of ThumbnailField'
+    option_list = BaseCommand.option_list + (
+        make_option('--patterns', default=None,
+                    help='Comma separated names of patterns to rebuild '
+                         '(default: all patterns)'),
+        make_option('--only-missing', action='store_true', default=False,
+                    help='Generate only thumbnails which do not exist'),
+        make_option('--chunk-size', type='int', default=500,
+                    help='The number of rows fetched at once'),
+        make_option('--workers', type='int', default=1,
+                    help='The number of worker threads'),
+        make_option('--processes', type='int', default=0,
+                    help='The number of worker processes used to render '
+                         'thumbnails (0 to render in worker threads)'),
+        make_option('--resume-from', default=None,
+                    help='Rebuild rows which primary key is greater than '
+                         'this value'),
+        make_option('--checkpoint', default=None,
+                    help='A file to save the primary key of the last '
+                         'processed row. The rebuild is resumed from the '
+                         'file if it exists'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: %s' % self.args)
+        model, field = self.get_model_field(args[0])
+        verbosity = int(options.get('verbosity', 1))
+        chunk_size = options['chunk_size']
+        workers = max(options['workers'], options['processes'], 1)
+        checkpoint = options['checkpoint']
+        resume_from = options['resume_from']
+        if resume_from is None and checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as fi:
+                resume_from = fi.read().strip() or None
+        if resume_from is not None:
+            # the primary key is not always an integer
+            try:
+                resume_from = model._meta.pk.to_python(resume_from)
+            except ValidationError:
+                raise CommandError('Invalid primary key: %s' % resume_from)
+        names = options['patterns']
+        if names:
+            names = self.expand_pattern_names(
+                field, [n.strip() for n in names.split(',') if n.strip()])
+        else:
+            names = [n for n in field.patterns.iterkeys() if n is not None]
+        executor = None
+        if options['processes']:
+            if futures is None:
+                raise CommandError(
+                    "'futures' package is required to use --processes")
+            executor = futures.ProcessPoolExecutor(options['processes'])
+
+        def rebuild(instance):
+            f = getattr(instance, field.attname)
+            if not f:
+                return
+            targets = names
+            if options['only_missing']:
+                targets = [n for n in names
+                           if not f._thumbnail_exists(
+                               f._get_thumbnail_filename(n))]
+            if targets:
+                f.update_thumbnail_files(executor=executor, names=targets)
+
+        def run(instance):
+            try:
+                rebuild(instance)
+                return None
+            except Exception as e:
+                return '%s: %s' % (instance.pk, e)
+
+        def run_batch(batch):
+            try:
+                return [run(instance) for instance in batch]
+            finally:
+                # database connections are thread local thus the connection
+                # opened in the worker thread is closed at the end of batch
+                connection.close()
+
+        pool = ThreadPool(workers) if workers > 1 else None
+        queryset = model._default_manager.order_by('pk')
+        if resume_from is not None:
+            queryset = queryset.filter(pk__gt=resume_from)
+        processed = failed = 0
+        started = time.time()
+        try:
+            while True:
+                chunk = list(queryset[:chunk_size])
+                if not chunk:
+                    break
+                if pool:
+                    batches = [chunk[i::workers] for i in range(workers)]
+                    errors = sum(pool.map(run_batch, batches), [])
+                else:
+                    errors = [run(instance) for instance in chunk]
+                for error in errors:
+                    if error:
+                        failed += 1
+                        self.stderr.write('Failed to rebuild %s\n' % error)
+                processed += len(chunk)
+                last = chunk[-1].pk
+                queryset = model._default_manager.order_by('pk').filter(
+                    pk__gt=last)
+                if checkpoint:
+                    with open(checkpoint, 'w') as fo:
+                        fo.write('%s\n' % last)
+                if verbosity > 0:
+                    elapsed = time.time() - started
+                    self.stdout.write(
+                        '%d rows processed (%.1f rows/sec), last pk: %s\n' % (
+                            processed, processed / max(elapsed, 1e-6), last))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            if executor:
+                executor.shutdown()
+        if verbosity > 0:
+            self.stdout.write('%d rows processed, %d failed\n' % (
+                processed, failed))
+
+    def expand_pattern_names(self, field, names):
+        """expand width ladders and format variants of the pattern names
+
+        A name of width ladder is expanded into the names of its rungs and
+        each name is followed by the names of its format variants.
+        """
+        expanded = []
+        for name in names:
+            if name in field.ladders:
+                bases = [rung_name for _, rung_name in field.ladders[name]]
+            elif name in field.patterns:
+                bases = [name]
+            else:
+                raise CommandError('Unknown pattern: %s' % name)
+            for base in bases:
+                variant_names = [variant_name for _, variant_name
+                                 in field.variants.get(base, ())]
+                for n in [base] + variant_names:
+                    if n not in expanded:
+                        expanded.append(n)
+        return expanded
+
+    def get_model_field(self, label):
+        try:
+            app_label, model_name, field_name = label.split('.')
+        except ValueError:
+            raise CommandError('Usage: %s' % self.args)
+        try:
+            model = get_model(app_label, model_name)
+        except LookupError:
+            # Django >= 1.7 raises LookupError for unknown models
+            model = None
+        if model is None:
+            raise CommandError('Unknown model: %s.%s' % (
+                app_label, model_name))
+        fields = [f for f in model._meta.fields if f.name == field_name]
+        if not fields or not isinstance(fields[0], ThumbnailField):
+            raise CommandError('%s is not a ThumbnailField' % label)
+        return model, fields[0]
@@ -0,0 +1,30 @@
+# coding=utf-8
+"""
+Middlewares of ThumbnailField
+
+``thumbnail_url`` and ``thumbnail_srcset`` template tags choose the output
+format of thumbnails with Accept header of the request thus the rendered
+page must not be shared between clients which accept different formats.
+Add ``VaryAcceptMiddleware`` to ``MIDDLEWARE_CLASSES``::
+
+    MIDDLEWARE_CLASSES = (
+        'thumbnailfield.middleware.VaryAcceptMiddleware',
+        ...
+    )
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+from django.utils.cache import patch_vary_headers
+
+
+class VaryAcceptMiddleware(object):
+
+    """Add ``Vary: Accept`` to responses which used Accept header
+
+    The template tags mark the request when they choose the output format
+    with Accept header.
+    """
+
+    def process_response(self, request, response):
+        if getattr(request, '_thumbnailfield_vary_accept', False):
+            patch_vary_headers(response, ('Accept',))
+        return response
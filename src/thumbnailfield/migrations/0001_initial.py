@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('app_label', models.CharField(max_length=100, verbose_name='app label')),
+                ('model_name', models.CharField(max_length=100, verbose_name='model name')),
+                ('field_name', models.CharField(max_length=100, verbose_name='field name')),
+                ('object_id', models.CharField(max_length=255, verbose_name='object id')),
+                ('pattern_name', models.CharField(max_length=100, verbose_name='pattern name', blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='date and time created')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('last_error', models.TextField(default='', verbose_name='last error', blank=True)),
+                ('failed', models.BooleanField(default=False, verbose_name='failed')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='thumbnailjob',
+            unique_together=set([('app_label', 'model_name', 'field_name', 'object_id', 'pattern_name')]),
+        ),
+    ]
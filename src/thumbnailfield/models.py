@@ -1,2 +1,33 @@
 # this is required to test thumbnailfield with Django Tests
 from thumbnailfield.process_methods import *
+
+from django.db import models
+from thumbnailfield.compatibility import _
+
+
+class ThumbnailJob(models.Model):
+
+    """A thumbnail generation job queued by DatabaseQueue
+
+    Jobs are processed by ``thumbnailfield_process_queue`` management
+    command. A job which failed is retried in the next run and it is kept
+    with ``failed=True`` (and never processed again) after ``max_attempts``
+    of DatabaseQueue.
+    """
+    app_label = models.CharField(_('app label'), max_length=100)
+    model_name = models.CharField(_('model name'), max_length=100)
+    field_name = models.CharField(_('field name'), max_length=100)
+    object_id = models.CharField(_('object id'), max_length=255)
+    pattern_name = models.CharField(_('pattern name'), max_length=100,
+                                    blank=True)
+    created_at = models.DateTimeField(_('date and time created'),
+                                      auto_now_add=True)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True, default='')
+    failed = models.BooleanField(_('failed'), default=False)
+
+    class Meta:
+        unique_together = (
+            ('app_label', 'model_name', 'field_name', 'object_id',
+             'pattern_name'),
+        )
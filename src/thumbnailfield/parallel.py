@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+Render thumbnails in worker processes
+
+PIL releases the GIL only in some operations thus generating thumbnails of
+many images in threads cannot use every core. The functions in this module
+hand the encoded source image and the patterns to a
+``concurrent.futures.ProcessPoolExecutor`` and receive the encoded
+thumbnails. ``futures`` package is required in Python 2.
+
+Worker processes import Django settings thus ``DJANGO_SETTINGS_MODULE``
+have to be available in the environment of the workers.
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import threading
+from django.core.exceptions import ImproperlyConfigured
+
+from thumbnailfield.conf import settings
+from thumbnailfield.utils import get_draft_size
+from thumbnailfield.utils import get_processed_images
+from thumbnailfield.utils import get_pil_save_options
+from thumbnailfield.compatibility import Image
+from thumbnailfield.compatibility import StringIO
+from thumbnailfield.compatibility import futures
+
+
+def render_thumbnails(data, patterns, pil_save_options=None):
+    """render thumbnails of the encoded image
+
+    This function is called in worker processes.
+
+    Attributes:
+        data -- Encoded source image (bytes)
+        patterns -- A dictionary of name and (process patterns, file format)
+        pil_save_options -- Options used in PIL image save method
+
+    It returns a dictionary of name and encoded thumbnail (bytes).
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> from thumbnailfield.compatibility import StringIO
+        >>> buf = StringIO()
+        >>> Image.new('RGB', (1000, 800)).save(buf, format='PNG')
+        >>> rendered = render_thumbnails(buf.getvalue(), {
+        ...     'tiny': ((100, 100), 'PNG'),
+        ... })
+        >>> Image.open(StringIO(rendered['tiny'])).size
+        (100, 80)
+    """
+    img = Image.open(StringIO(data))
+    if img.format == 'JPEG':
+        size = get_draft_size(None, img, [p for p, _ in patterns.values()])
+        if size is not None:
+            img.draft(img.mode, size)
+    processed = get_processed_images(
+        None, img, dict((name, p) for name, (p, _) in patterns.iteritems()))
+    rendered = {}
+    for name, thumbs in processed.iteritems():
+        file_fmt = patterns[name][1]
+        buf = StringIO()
+        thumbs.save(buf, format=file_fmt,
+                    **get_pil_save_options(file_fmt, pil_save_options))
+        rendered[name] = buf.getvalue()
+    return rendered
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """get process pool shared in this process
+
+    The number of worker processes is configured with
+    ``THUMBNAILFIELD_PROCESS_POOL_WORKERS`` (``None`` for the number of
+    processors).
+    """
+    global _pool
+    if futures is None:
+        raise ImproperlyConfigured(
+            "'futures' package is required to use process pool in Python 2")
+    with _pool_lock:
+        if _pool is None:
+            _pool = futures.ProcessPoolExecutor(
+                settings.THUMBNAILFIELD_PROCESS_POOL_WORKERS)
+        return _pool
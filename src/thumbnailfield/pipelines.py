@@ -0,0 +1,430 @@
+# coding=utf-8
+"""
+Compiled process patterns
+
+Process patterns of ThumbnailField are compiled into Pipeline instances when
+the field is constructed. Process methods are resolved from
+settings.THUMBNAILFIELD_PROCESS_METHOD_TABLE, default process method/options
+are applied and ``error_check`` of each process method is called at that time
+thus misconfigured patterns are reported on startup instead of the first
+request.
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import hashlib
+from collections import namedtuple
+
+from thumbnailfield.conf import settings
+from thumbnailfield.compatibility import Image
+
+
+Step = namedtuple('Step', ('width', 'height', 'method', 'options',
+                           'method_name'))
+
+
+class Pipeline(object):
+
+    """Compiled process patterns
+
+    Attributes:
+        steps -- A tuple of Step (width, height, method, options,
+                 method_name)
+        plan -- A tuple of Step actually executed for RGB and L images
+                (see optimize_steps)
+        sequential_plan -- A tuple of Step actually executed for images in
+                           other modes (steps are not reordered)
+        fingerprint -- A stable fingerprint of the steps
+        scalable -- True if all steps only scale the image (all process
+                    methods have ``get_size`` attribute)
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> pipeline = compile_patterns(((640, 480, 'resize'), (100, 100)))
+        >>> img = Image.new('RGBA', (1000, 800))
+        >>> pipeline(img).size
+        (100, 75)
+        >>> pipeline.get_size(img.size)
+        (100, 75)
+        >>> pipeline.scalable
+        True
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(steps)
+        self.plan = tuple(optimize_steps(self.steps))
+        self.sequential_plan = tuple(optimize_steps(self.steps,
+                                                    reorder=False))
+        normalized = [(s.width, s.height, s.method_name,
+                       sorted(s.options.items())) for s in self.steps]
+        self.fingerprint = hashlib.md5(
+            repr(normalized).encode('utf-8')).hexdigest()[:8]
+        self.scalable = all(getattr(s.method, 'get_size', None)
+                            for s in self.steps)
+
+    def __call__(self, img):
+        """process PIL image and return the processed PIL image
+
+        The given image is never modified. Once a step has created a new
+        image, the image is owned by the pipeline and following steps modify
+        it in place when the process method has ``inplace`` attribute.
+        """
+        processed = img
+        owned = False
+        if img.mode in REORDERABLE_MODES:
+            plan = self.plan
+        else:
+            # e.g. P and 1 images are scaled with NEAREST before converted
+            plan = self.sequential_plan
+        for step in plan:
+            inplace = getattr(step.method, 'inplace', None)
+            if owned and inplace:
+                processed = inplace(processed, step.width, step.height,
+                                    **step.options)
+            else:
+                # process methods may return the given image as it is thus
+                # it is owned only when a new image is returned
+                result = step.method(processed, step.width, step.height,
+                                     **step.options)
+                owned = owned or result is not processed
+                processed = result
+        if not owned:
+            processed = processed.copy()
+        return processed
+
+    def get_size(self, size):
+        """get the size of the processed image (or None if not scalable)"""
+        if not self.scalable:
+            return None
+        for step in self.steps:
+            size = step.method.get_size(size, step.width, step.height,
+                                        **step.options)
+        return tuple(size)
+
+    def is_identity(self, size):
+        """return True if the pipeline does not change the image of size
+
+        A pipeline is identity for the size when all steps only scale the
+        image and none of them changes the size (e.g. the image already fits
+        in the box of thumbnail)
+
+        Usage::
+            >>> pipeline = compile_patterns(((640, 480, 'resize'),
+            ...                              (320, 240)))
+            >>> pipeline.is_identity((100, 100))
+            True
+            >>> pipeline.is_identity((1000, 100))
+            False
+            >>> compile_patterns((None, None, 'grayscale')).is_identity(
+            ...     (100, 100))
+            False
+        """
+        if not self.scalable:
+            return False
+        size = tuple(size)
+        for step in self.steps:
+            processed = step.method.get_size(size, step.width, step.height,
+                                             **step.options)
+            if tuple(processed) != size:
+                return False
+        return True
+
+    @property
+    def resample(self):
+        """resampling filter of the last step"""
+        return self.steps[-1].options.get('resample', Image.ANTIALIAS)
+
+
+# modes of images whose color operations can be applied after scaling (the
+# image is resampled with the filter of the step in these modes)
+REORDERABLE_MODES = ('RGB', 'L')
+
+
+def _is_downscale(step):
+    return (getattr(step.method, 'get_size', None) and
+            getattr(step.method, 'shrinking', False) and
+            not step.options.get('force', False))
+
+
+def _crop_and_scale(img, width, height, box, scale_method, **options):
+    # crop the box region and scale it with a single resample
+    crop_size = (box[2] - box[0], box[3] - box[1])
+    size = tuple(scale_method.get_size(crop_size, width, height, **options))
+    inside = (box[0] >= 0 and box[1] >= 0 and
+              box[2] <= img.size[0] and box[3] <= img.size[1])
+    if size == crop_size or not inside:
+        cropped = img.crop(box)
+        return scale_method(cropped, width, height, **options)
+    resize_options = dict(options)
+    resize_options.pop('force', None)
+    try:
+        return img.resize(size, box=box, **resize_options)
+    except TypeError:
+        # PIL does not support 'box' argument (Pillow < 4.3)
+        return scale_method(img.crop(box), width, height, **options)
+
+
+def optimize_steps(steps, reorder=True):
+    """optimize steps with rounding differences of the result only
+
+    -   Color operations (process methods with ``color_operation`` attribute
+        such as grayscale) are moved after the following scale steps
+        (``get_size`` attribute) which never enlarge the image (``shrinking``
+        attribute) so that the color operations are applied to the smaller
+        image. The result is changed by the reorder unless the image is in
+        REORDERABLE_MODES thus Pipeline uses the steps optimized with
+        ``reorder=False`` for the other images.
+    -   A crop step (``get_box`` attribute) followed by a scale step
+        (``get_size`` attribute) is folded into a single ``Image.resize``
+        call with ``box`` argument.
+
+    Attributes:
+        steps -- A list of Step
+        reorder -- If False, color operations are not moved
+
+    Usage::
+        >>> steps = compile_patterns(((None, None, 'grayscale'),
+        ...                           (800, 400, 'resize'))).steps
+        >>> [s.method_name for s in optimize_steps(steps)]
+        ['resize', 'grayscale']
+        >>> [s.method_name for s in optimize_steps(steps, reorder=False)]
+        ['grayscale', 'resize']
+        >>> steps = compile_patterns(((None, None, 'sepia'),
+        ...                           (800, 400, 'resize'))).steps
+        >>> [s.method_name for s in optimize_steps(steps)]
+        ['sepia', 'resize']
+        >>> steps = compile_patterns(((320, 240, 'crop',
+        ...                            {'left': 0, 'upper': 0}),
+        ...                           (160, 120, 'resize'))).steps
+        >>> [s.method_name for s in optimize_steps(steps)]
+        ['crop+resize']
+    """
+    steps = list(steps)
+    swapped = reorder
+    while swapped:
+        swapped = False
+        for i in range(len(steps) - 1):
+            a, b = steps[i], steps[i + 1]
+            if getattr(a.method, 'color_operation', False) and \
+                    _is_downscale(b):
+                steps[i], steps[i + 1] = b, a
+                swapped = True
+    optimized = []
+    for step in steps:
+        previous = optimized[-1] if optimized else None
+        if previous and getattr(previous.method, 'get_box', None) and \
+                getattr(step.method, 'get_size', None):
+            box = previous.method.get_box(previous.width, previous.height,
+                                          **previous.options)
+            options = dict(step.options, box=box, scale_method=step.method)
+            step = Step(step.width, step.height, _crop_and_scale, options,
+                        '%s+%s' % (previous.method_name, step.method_name))
+            optimized.pop()
+        optimized.append(step)
+    return optimized
+
+
+def _split_pattern(pattern):
+    process_method = None
+    process_options = settings.THUMBNAILFIELD_DEFAULT_PROCESS_OPTIONS
+    if len(pattern) == 1:
+        width = height = pattern[0]
+    if len(pattern) == 2:
+        width, height = pattern
+    elif len(pattern) == 3:
+        width, height, process_method = pattern
+    elif len(pattern) == 4:
+        width, height, process_method, process_options = pattern
+    process_method = (
+        process_method or settings.THUMBNAILFIELD_DEFAULT_PROCESS_METHOD)
+    return width, height, process_method, process_options
+
+
+def _normalize_patterns(patterns):
+    if len(patterns) > 0 and not isinstance(patterns[0], (list, tuple)):
+        patterns = [patterns]
+    return patterns
+
+
+def compile_patterns(patterns, f=None):
+    """compile process patterns into Pipeline
+
+    Attributes:
+        patterns -- Process patterns (or Pipeline)
+        f -- ThumbnailField or ThumbnailFieldFile instance passed to
+             ``error_check`` of process methods
+
+    ``error_check`` of process methods is called with ``img=None`` because
+    patterns are compiled before any image is available.
+    It returns ``None`` for ``None`` patterns.
+
+    Usage::
+        >>> from django.core.exceptions import ImproperlyConfigured
+        >>> pipeline = compile_patterns((320, 240, 'crop',
+        ...                              {'left': 0, 'upper': 0}))
+        >>> pipeline.steps[0].method_name
+        'crop'
+        >>> pipeline.scalable
+        False
+        >>> compile_patterns(None) is None
+        True
+        >>> try:
+        ...     compile_patterns((320, 240, 'crop'))
+        ... except ImproperlyConfigured:
+        ...     print('misconfigured')
+        misconfigured
+    """
+    if patterns is None or isinstance(patterns, Pipeline):
+        return patterns
+    process_method_table = settings.THUMBNAILFIELD_PROCESS_METHOD_TABLE
+    steps = []
+    for pattern in _normalize_patterns(patterns):
+        width, height, process_method, process_options = _split_pattern(
+            pattern)
+        if callable(process_method):
+            method = process_method
+            method_name = '%s.%s' % (process_method.__module__,
+                                     process_method.__name__)
+        else:
+            method = process_method_table.get(process_method)
+            method_name = process_method
+        if not callable(method):
+            raise AttributeError(
+                'process_method have to be a string name defined in '
+                'THUMBNAILFIELD_PROCESS_METHOD_TABLE or method.')
+        process_options = dict(process_options)
+        if getattr(method, 'error_check', None):
+            method.error_check(f, None, width, height, **process_options)
+        steps.append(Step(width, height, method, process_options,
+                          method_name))
+    return Pipeline(steps)
+
+
+# the height of ladder rungs (rungs are bounded only by the width)
+LADDER_HEIGHT = 0x7fffffff
+
+
+def get_ladder_rung_name(name, width):
+    """get the pattern name of the rung of the width ladder
+
+    Usage::
+        >>> get_ladder_rung_name('hero', 320)
+        'hero_320w'
+    """
+    return '%s_%dw' % (name, width)
+
+
+def expand_ladders(patterns):
+    """expand width ladders of patterns into a pattern of each width
+
+    A width ladder is a dictionary pattern which has ``widths`` (a list of
+    widths), ``method`` (default = 'thumbnail') and ``options`` (default =
+    settings.THUMBNAILFIELD_DEFAULT_PROCESS_OPTIONS). Each width is expanded
+    into a pattern named ``<name>_<width>w`` which scales the image to the
+    width with preserving the aspect ratio.
+
+    Attributes:
+        patterns -- A dictionary of named patterns
+
+    Returns:
+        A tuple of the expanded patterns and a dictionary of the ladder name
+        and a sorted list of (width, rung name)
+
+    Usage::
+        >>> patterns, ladders = expand_ladders({
+        ...     'hero': {'widths': [640, 320]},
+        ...     'tiny': (160, 120),
+        ... })
+        >>> sorted(patterns.keys())
+        ['hero_320w', 'hero_640w', 'tiny']
+        >>> patterns['hero_320w'] == ((320, LADDER_HEIGHT, 'thumbnail',
+        ...     settings.THUMBNAILFIELD_DEFAULT_PROCESS_OPTIONS),)
+        True
+        >>> ladders['hero']
+        [(320, 'hero_320w'), (640, 'hero_640w')]
+    """
+    expanded = {}
+    ladders = {}
+    for name, pattern in patterns.iteritems():
+        if not isinstance(pattern, dict):
+            expanded[name] = pattern
+            continue
+        method = pattern.get('method', 'thumbnail')
+        options = pattern.get(
+            'options', settings.THUMBNAILFIELD_DEFAULT_PROCESS_OPTIONS)
+        rungs = []
+        for width in sorted(set(pattern['widths'])):
+            rung_name = get_ladder_rung_name(name, width)
+            expanded[rung_name] = ((width, LADDER_HEIGHT, method, options),)
+            rungs.append((width, rung_name))
+        ladders[name] = rungs
+    return expanded, ladders
+
+
+def get_variant_name(name, file_fmt):
+    """get the pattern name of the variant of the output format
+
+    Usage::
+        >>> get_variant_name('large', 'WEBP')
+        'large_webp'
+    """
+    return '%s_%s' % (name, file_fmt.lower())
+
+
+def is_format_available(file_fmt):
+    """return True if the Pillow build can save the format
+
+    Usage::
+        >>> is_format_available('PNG')
+        True
+        >>> is_format_available('UNKNOWN')
+        False
+    """
+    Image.init()
+    return file_fmt in Image.SAVE
+
+
+def expand_formats(patterns, formats, ladders=None):
+    """expand output formats of patterns into a pattern of each format
+
+    Each output format of a named pattern is expanded into a pattern named
+    ``<name>_<format>`` which has the same process patterns. Formats of a
+    width ladder are applied to each rung of the ladder. Formats which the
+    Pillow build cannot save (e.g. AVIF) are ignored.
+
+    Attributes:
+        patterns -- A dictionary of named patterns
+        formats -- A dictionary of the pattern name and a list of PIL format
+                   names in the order of preference
+        ladders -- A dictionary of width ladders (see expand_ladders)
+
+    Returns:
+        A tuple of the expanded patterns and a dictionary of the pattern name
+        and a list of (format, variant name)
+
+    Usage::
+        >>> patterns, variants = expand_formats(
+        ...     {'large': (640, 480), 'tiny': (160, 120)},
+        ...     {'large': ['UNKNOWN', 'webp']})
+        >>> sorted(patterns.keys())
+        ['large', 'large_webp', 'tiny']
+        >>> variants
+        {'large': [('WEBP', 'large_webp')]}
+    """
+    ladders = ladders or {}
+    expanded = dict(patterns)
+    variants = {}
+    for name, file_fmts in formats.iteritems():
+        if name in ladders:
+            names = [rung_name for _, rung_name in ladders[name]]
+        else:
+            names = [name]
+        file_fmts = [f.upper() for f in file_fmts]
+        file_fmts = [f for f in file_fmts if is_format_available(f)]
+        for name in names:
+            if name not in patterns:
+                raise AttributeError(
+                    "formats are specified to an unknown pattern '%s'" % name)
+            variants[name] = [(f, get_variant_name(name, f))
+                              for f in file_fmts]
+            for file_fmt, variant_name in variants[name]:
+                expanded[variant_name] = patterns[name]
+    return expanded, variants
@@ -0,0 +1,243 @@
+# coding=utf-8
+"""
+Header-only probe of image format and dimensions
+
+The format and the dimensions of PNG, JPEG, GIF, WebP, BMP, TIFF, AVIF and
+HEIF images are read from the headers without decoding the pixels. Only the
+first few KB of the file are read in most cases; JPEG segments and TIFF
+directories are reached with ``seek`` thus only the required ranges are read
+when the file supports random access.
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import struct
+from collections import namedtuple
+
+
+ImageInfo = namedtuple('ImageInfo', ('format', 'width', 'height'))
+
+# the size of the first read
+HEADER_SIZE = 4096
+
+# JPEG start of frame markers (C4, C8 and CC are not SOF)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - frozenset(
+    (0xC4, 0xC8, 0xCC))
+
+# ISO base media file format brands of AVIF and HEIF
+_AVIF_BRANDS = frozenset((b'avif', b'avis'))
+_HEIF_BRANDS = frozenset((b'heic', b'heix', b'heim', b'heis', b'hevc',
+                          b'hevx', b'mif1', b'msf1'))
+
+
+class _Reader(object):
+
+    """Read ranges of a file object with a buffer of the first bytes"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.start = fileobj.tell() if hasattr(fileobj, 'tell') else 0
+        self.head = fileobj.read(HEADER_SIZE)
+
+    def read(self, offset, size):
+        if offset + size <= len(self.head):
+            return self.head[offset:offset + size]
+        if len(self.head) < HEADER_SIZE:
+            # the whole file is in the buffer
+            return self.head[offset:offset + size]
+        self.fileobj.seek(self.start + offset)
+        return self.fileobj.read(size)
+
+
+def _probe_png(reader, head):
+    if head[:8] != b'\x89PNG\r\n\x1a\n' or head[12:16] != b'IHDR':
+        return None
+    width, height = struct.unpack('>II', head[16:24])
+    return ImageInfo('PNG', width, height)
+
+
+def _probe_gif(reader, head):
+    if head[:6] not in (b'GIF87a', b'GIF89a'):
+        return None
+    width, height = struct.unpack('<HH', head[6:10])
+    return ImageInfo('GIF', width, height)
+
+
+def _probe_bmp(reader, head):
+    if head[:2] != b'BM' or len(head) < 26:
+        return None
+    header_size = struct.unpack('<I', head[14:18])[0]
+    if header_size == 12:
+        width, height = struct.unpack('<HH', head[18:22])
+    else:
+        width, height = struct.unpack('<ii', head[18:26])
+    return ImageInfo('BMP', width, abs(height))
+
+
+def _probe_webp(reader, head):
+    if head[:4] != b'RIFF' or head[8:12] != b'WEBP' or len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', head[26:30])
+        return ImageInfo('WEBP', width & 0x3fff, height & 0x3fff)
+    elif chunk == b'VP8L':
+        bits = struct.unpack('<I', head[21:25])[0]
+        return ImageInfo('WEBP', (bits & 0x3fff) + 1,
+                         ((bits >> 14) & 0x3fff) + 1)
+    elif chunk == b'VP8X':
+        width = struct.unpack('<I', head[24:27] + b'\0')[0] + 1
+        height = struct.unpack('<I', head[27:30] + b'\0')[0] + 1
+        return ImageInfo('WEBP', width, height)
+    return None
+
+
+def _probe_jpeg(reader, head):
+    if head[:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while True:
+        marker = reader.read(offset, 4)
+        if len(marker) < 4 or marker[0:1] != b'\xff':
+            return None
+        code = ord(marker[1:2])
+        if code == 0xFF:
+            # fill byte
+            offset += 1
+            continue
+        if code == 0xDA:
+            # start of scan without frame header
+            return None
+        length = struct.unpack('>H', marker[2:4])[0]
+        if code in _JPEG_SOF_MARKERS:
+            frame = reader.read(offset + 5, 4)
+            if len(frame) < 4:
+                return None
+            height, width = struct.unpack('>HH', frame)
+            return ImageInfo('JPEG', width, height)
+        offset += 2 + length
+
+
+def _probe_tiff(reader, head):
+    if head[:4] == b'II*\0':
+        endian = '<'
+    elif head[:4] == b'MM\0*':
+        endian = '>'
+    else:
+        return None
+    offset = struct.unpack(endian + 'I', head[4:8])[0]
+    count = struct.unpack(endian + 'H', reader.read(offset, 2))[0]
+    entries = reader.read(offset + 2, count * 12)
+    dimensions = {}
+    for i in range(0, len(entries) - 11, 12):
+        tag, type_ = struct.unpack(endian + 'HH', entries[i:i + 4])
+        if tag not in (256, 257):
+            continue
+        if type_ == 3:
+            value = struct.unpack(endian + 'H', entries[i + 8:i + 10])[0]
+        else:
+            value = struct.unpack(endian + 'I', entries[i + 8:i + 12])[0]
+        dimensions[tag] = value
+    if len(dimensions) != 2:
+        return None
+    return ImageInfo('TIFF', dimensions[256], dimensions[257])
+
+
+def _get_isobmff_format(head):
+    if head[4:8] != b'ftyp' or len(head) < 12:
+        return None
+    size = struct.unpack('>I', head[:4])[0]
+    # the major brand and the compatible brands
+    brands = set([head[8:12]])
+    brands.update(head[i:i + 4] for i in range(16, min(size, len(head)), 4))
+    if brands & _AVIF_BRANDS:
+        return 'AVIF'
+    elif brands & _HEIF_BRANDS:
+        return 'HEIF'
+    return None
+
+
+def _probe_isobmff(reader, head):
+    fmt = _get_isobmff_format(head)
+    if fmt is None:
+        return None
+    # the image spatial extents property of the first item
+    offset = head.find(b'ispe')
+    if offset < 4 or len(head) < offset + 16:
+        return None
+    width, height = struct.unpack('>II', head[offset + 8:offset + 16])
+    return ImageInfo(fmt, width, height)
+
+
+_PROBES = (
+    _probe_png, _probe_jpeg, _probe_gif, _probe_webp, _probe_bmp,
+    _probe_tiff, _probe_isobmff,
+)
+
+
+def get_image_info(fileobj):
+    """get ImageInfo (format, width, height) of fileobj from the headers
+
+    It returns None when the format is not supported or the headers are
+    broken. The position of fileobj is restored.
+
+    Attribute:
+        fileobj -- A file-like object of an encoded image
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> from thumbnailfield.compatibility import StringIO
+        >>> img = Image.new('RGB', (320, 240))
+        >>> for fmt in ('PNG', 'JPEG', 'GIF', 'BMP', 'TIFF'):
+        ...     buf = StringIO()
+        ...     img.save(buf, format=fmt)
+        ...     _ = buf.seek(0)
+        ...     info = get_image_info(buf)
+        ...     assert info == (fmt, 320, 240), info
+        >>> get_image_info(StringIO(b'not an image')) is None
+        True
+    """
+    position = fileobj.tell() if hasattr(fileobj, 'tell') else None
+    try:
+        reader = _Reader(fileobj)
+        for probe in _PROBES:
+            try:
+                info = probe(reader, reader.head)
+            except struct.error:
+                info = None
+            if info:
+                return info
+        return None
+    finally:
+        if position is not None:
+            fileobj.seek(position)
+
+
+def get_image_format(fileobj):
+    """get PIL format name of fileobj from the headers
+
+    It returns None when the format is not supported. AVIF and HEIF images
+    are recognized from the brands even when the dimensions are not found
+    in the headers. The position of fileobj is restored.
+
+    Attribute:
+        fileobj -- A file-like object of an encoded image
+
+    Usage::
+        >>> from thumbnailfield.compatibility import StringIO
+        >>> get_image_format(StringIO(
+        ...     b'\\x00\\x00\\x00\\x18ftypavif\\x00\\x00\\x00\\x00mif1miaf'))
+        'AVIF'
+        >>> get_image_format(StringIO(
+        ...     b'\\x00\\x00\\x00\\x18ftypheic\\x00\\x00\\x00\\x00mif1heic'))
+        'HEIF'
+        >>> get_image_format(StringIO(b'not an image')) is None
+        True
+    """
+    info = get_image_info(fileobj)
+    if info is not None:
+        return info.format
+    position = fileobj.tell() if hasattr(fileobj, 'tell') else None
+    try:
+        return _get_isobmff_format(fileobj.read(HEADER_SIZE))
+    finally:
+        if position is not None:
+            fileobj.seek(position)
@@ -4,6 +4,7 @@ Builtin ThumbnailField process methods
 """
 __author__ = "Alisue <lambdalisue@hashnote.net>"
 from django.core.exceptions import ImproperlyConfigured
+from thumbnailfield.compatibility import Image
 from thumbnailfield.compatibility import ImageOps
 
 
@@ -21,10 +22,17 @@ def get_grayscale_image(img, width, height, **options):
         >>> img = Image.new('RGBA', (1000, 800))
         >>> thumb = get_grayscale_image(img, 100, 100)
     """
-    grayscale = img.copy()
     if img.mode != 'L':
-        grayscale = grayscale.convert('L')
-    return grayscale
+        return img.convert('L')
+    return img.copy()
+
+
+def _grayscale_inplace(img, width, height, **options):
+    # the image is already grayscale when the mode is 'L'
+    if img.mode != 'L':
+        return img.convert('L')
+    return img
+get_grayscale_image.inplace = _grayscale_inplace
 
 
 def _grayscale_error_check(f, img, width, height, **options):
@@ -33,6 +41,19 @@ def _grayscale_error_check(f, img, width, height, **options):
         raise ImproperlyConfigured(f, "'width' and 'height' must be None in "
                                       "'grayscale' pattern")
 get_grayscale_image.error_check = _grayscale_error_check
+# grayscale does not depend on the geometry thus it can be applied after the
+# image has been scaled down
+get_grayscale_image.color_operation = True
+
+
+def _make_linear_ramp(white):
+    # putpalette expects [r,g,b,r,g,b,...]
+    ramp = []
+    r, g, b = white
+    for i in range(255):
+        ramp.extend((r * i / 255, g * i / 255, b * i / 255))
+    return [int(round(x)) for x in ramp]
+SEPIA_PALETTE = _make_linear_ramp((255, 240, 192))
 
 
 def get_sepia_image(img, width, height, **options):
@@ -49,24 +70,15 @@ def get_sepia_image(img, width, height, **options):
         >>> img = Image.new('RGBA', (1000, 800))
         >>> thumb = get_sepia_image(img, 100, 100)
     """
-    def make_linear_ramp(white):
-        # putpalette expects [r,g,b,r,g,b,...]
-        ramp = []
-        r, g, b = white
-        for i in range(255):
-            ramp.extend((r * i / 255, g * i / 255, b * i / 255))
-        return ramp
-    sepia = make_linear_ramp((255, 240, 192))
-
-    # make the image grayscale
-    grayscale = get_grayscale_image(img, width, height, **options)
+    # make the image grayscale (autocontrast below creates a new image thus
+    # the grayscale image does not need to be copied)
+    grayscale = _grayscale_inplace(img, width, height, **options)
 
     # optional: apply contrast enhancement here, e.g.
     grayscale = ImageOps.autocontrast(grayscale)
 
     # apply sepia palette
-    transform = lambda x: int(round(x))
-    grayscale.putpalette(map(transform, sepia))
+    grayscale.putpalette(SEPIA_PALETTE)
 
     # convert back to RGB so we can save it as JPEG
     # (alternatively, save it in PNG or similar)
@@ -79,6 +91,8 @@ def _sepia_error_check(f, img, width, height, **options):
         raise ImproperlyConfigured(
             f, "'width' and 'height' must be None in 'sepia' pattern")
 get_sepia_image.error_check = _sepia_error_check
+# sepia is not a color operation: the contrast enhancement is computed from
+# the histogram which is changed by scaling the image down
 
 
 def get_cropped_image(img, width, height, left, upper, **options):
@@ -114,6 +128,12 @@ def _cropped_error_check(f, img, width, height, **options):
 get_cropped_image.error_check = _cropped_error_check
 
 
+def _cropped_get_box(width, height, left, upper, **options):
+    # crop pattern takes the box region of the image
+    return left, upper, left + width, upper + height
+get_cropped_image.get_box = _cropped_get_box
+
+
 def get_resized_image(img, width, height, force=False, **options):
     """get resized image
 
@@ -130,10 +150,18 @@ def get_resized_image(img, width, height, force=False, **options):
         >>> assert thumb.size[0] == 100
         >>> assert thumb.size[1] == 100
     """
-    thumbs = img.copy()
     if force or img.size[0] > width or img.size[1] > height:
-        thumbs = img.resize(size=(width, height), **options)
-    return thumbs
+        return img.resize(size=(width, height), **options)
+    return img.copy()
+
+
+def _resized_get_size(size, width, height, force=False, **options):
+    # resize pattern scales the whole image to width/height
+    if force or size[0] > width or size[1] > height:
+        return width, height
+    return size
+get_resized_image.get_size = _resized_get_size
+get_resized_image.shrinking = True
 
 
 def get_thumbnail_image(img, width, height, **options):
@@ -152,6 +180,33 @@ def get_thumbnail_image(img, width, height, **options):
         >>> assert thumb.size[0] == 100
         >>> assert thumb.size[1] == 80
     """
-    thumbs = img.copy()
-    thumbs.thumbnail(size=(width, height), **options)
-    return thumbs
+    # resize the image directly instead of calling thumbnail method of a copy
+    # to prevent copying the original sized image. the default resampling
+    # filter of thumbnail method is used (resize uses NEAREST in Pillow < 7)
+    size = _thumbnail_get_size(img.size, width, height, **options)
+    if size == img.size:
+        return img.copy()
+    resample = options.pop('resample', Image.BICUBIC)
+    return img.resize(size, resample, **options)
+
+
+def _thumbnail_inplace(img, width, height, **options):
+    # the image is owned by the caller thus it can be modified in place
+    img.thumbnail(size=(width, height), **options)
+    return img
+get_thumbnail_image.inplace = _thumbnail_inplace
+
+
+def _thumbnail_get_size(size, width, height, **options):
+    # thumbnail pattern scales the whole image with preserving the aspect
+    # ratio (the same calculation as PIL Image.thumbnail)
+    x, y = size
+    if x > width:
+        y = int(max(y * width / x, 1))
+        x = int(width)
+    if y > height:
+        x = int(max(x * height / y, 1))
+        y = int(height)
+    return x, y
+get_thumbnail_image.get_size = _thumbnail_get_size
+get_thumbnail_image.shrinking = True
@@ -0,0 +1,217 @@
+# coding=utf-8
+"""
+Bulk prefetch of thumbnails
+
+Accessing ``entry.thumbnail.small_url`` of each row in a list view asks the
+storage whether the thumbnail exists row by row. ``prefetch_thumbnails``
+checks the existence of the thumbnails of all rows with a single directory
+listing per directory, generates the missing thumbnails concurrently and
+fills the thumbnail caches of the field files thus the following accesses do
+not touch the storage.
+
+Usage::
+
+    from thumbnailfield.query import prefetch_thumbnails
+
+    entries = prefetch_thumbnails(Entry.objects.all(), 'thumbnail',
+                                  patterns=['small'])
+
+Or with ThumbnailManager::
+
+    class Entry(models.Model):
+        thumbnail = ThumbnailField(...)
+
+        objects = ThumbnailManager()
+
+    entries = Entry.objects.prefetch_thumbnails('thumbnail', ['small'])
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import os
+from multiprocessing.pool import ThreadPool
+from django.db import models
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.db.models.fields.files import ImageFieldFile
+
+from thumbnailfield.indexes import get_existence_index
+from thumbnailfield.queues import get_queue
+
+
+def _listdir(storage, directory):
+    """return a set of filenames in the directory or None if unavailable"""
+    try:
+        return set(storage.listdir(directory)[1])
+    except NotImplementedError:
+        return None
+    except (IOError, OSError):
+        # the directory does not exist yet
+        return set()
+
+
+def prefetch_thumbnails(objects, field_name, patterns=None, workers=4):
+    """prefetch thumbnails of field_name of objects
+
+    Thumbnails recorded in the manifest (see ``manifest_field`` of
+    ThumbnailField) are answered without I/O. The existence of the other
+    thumbnails is checked with a single ``storage.listdir`` per directory
+    (storages which do not support ``listdir`` are asked file by file).
+    Missing thumbnails are generated in a thread pool (or enqueued when the
+    field is ``asynchronous``) and ``_thumbnail_file_<name>_cache`` of each
+    field file is filled.
+
+    Attribute:
+        objects -- A queryset or a list of model instances
+        field_name -- A name of ThumbnailField
+        patterns -- A list of names of thumbnail patterns (default = all)
+        workers -- The number of threads used to generate thumbnails
+
+    Returns:
+        A list of the model instances
+    """
+    objects = list(objects)
+    field_files = []
+    for obj in objects:
+        field_file = getattr(obj, field_name)
+        if field_file:
+            field_files.append(field_file)
+    if not field_files:
+        return objects
+
+    # collect thumbnail filenames grouped by storage and directory
+    entries = []
+    directories = {}
+    for field_file in field_files:
+        if patterns is None:
+            names = field_file.get_pattern_names()
+        else:
+            names = patterns
+        for name in names:
+            if name is None or not field_file.pipelines.get(name):
+                # the original or nothing to generate
+                continue
+            if field_file._is_oversized(name):
+                # the rung of width ladder is never generated
+                continue
+            attr_name = '_thumbnail_file_%s_cache' % name
+            if getattr(field_file, attr_name, None):
+                continue
+            entry = field_file._get_manifest_entry(name)
+            if entry:
+                # the thumbnail is known by the manifest
+                setattr(field_file, attr_name,
+                        field_file._get_manifest_file(name, entry))
+                continue
+            filename = field_file._get_thumbnail_filename(name)
+            entries.append((field_file, name, filename))
+            key = (id(field_file.storage), os.path.dirname(filename))
+            directories[key] = field_file.storage
+
+    # check the existence in bulk
+    listings = {}
+    for key, storage in directories.items():
+        listings[key] = _listdir(storage, key[1])
+
+    index = get_existence_index()
+    missing = {}
+    for field_file, name, filename in entries:
+        key = (id(field_file.storage), os.path.dirname(filename))
+        listing = listings[key]
+        if listing is None:
+            exists = field_file._thumbnail_exists(filename)
+        else:
+            exists = os.path.basename(filename) in listing
+            if exists and index:
+                index.add(field_file.storage, filename)
+        if exists:
+            thumbs_file = ImageFieldFile(field_file.instance,
+                                         field_file.field,
+                                         filename)
+            setattr(field_file, '_thumbnail_file_%s_cache' % name,
+                    thumbs_file)
+        elif field_file.field.asynchronous:
+            get_queue().enqueue(field_file, name)
+        else:
+            # FieldFile compares by name thus id is used for the key
+            item = missing.setdefault(id(field_file), (field_file, []))
+            item[1].append(name)
+
+    # generate missing thumbnails concurrently (one decode per field file)
+    def generate(item):
+        field_file, names = item
+        field_file.update_thumbnail_files(names=names)
+
+    def generate_in_thread(item):
+        try:
+            generate(item)
+        finally:
+            # database connections are thread local thus the connection
+            # opened to update the manifest in the worker thread is closed
+            connection.close()
+
+    if len(missing) > 1 and workers > 1:
+        pool = ThreadPool(min(workers, len(missing)))
+        try:
+            pool.map(generate_in_thread, missing.values())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for item in missing.values():
+            generate(item)
+    return objects
+
+
+class ThumbnailQuerySet(QuerySet):
+
+    """QuerySet which prefetches thumbnails when it is evaluated"""
+
+    def __init__(self, *args, **kwargs):
+        super(ThumbnailQuerySet, self).__init__(*args, **kwargs)
+        self._thumbnail_prefetches = []
+
+    def _clone(self, *args, **kwargs):
+        clone = super(ThumbnailQuerySet, self)._clone(*args, **kwargs)
+        clone._thumbnail_prefetches = self._thumbnail_prefetches[:]
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super(ThumbnailQuerySet, self)._fetch_all()
+        if fetched and self._thumbnail_prefetches:
+            for field_name, patterns in self._thumbnail_prefetches:
+                prefetch_thumbnails(self._result_cache, field_name, patterns)
+
+    if not hasattr(QuerySet, '_fetch_all'):
+        # Django < 1.6 fills the result cache from iterator() in chunks thus
+        # the rows are fetched and prefetched at once in iterator()
+        def iterator(self):
+            objects = super(ThumbnailQuerySet, self).iterator()
+            if self._thumbnail_prefetches:
+                objects = list(objects)
+                for field_name, patterns in self._thumbnail_prefetches:
+                    prefetch_thumbnails(objects, field_name, patterns)
+            return iter(objects)
+
+    def prefetch_thumbnails(self, field_name, patterns=None):
+        """return a new QuerySet which prefetches thumbnails of field_name
+
+        Attribute:
+            field_name -- A name of ThumbnailField
+            patterns -- A list of names of thumbnail patterns (default = all)
+        """
+        clone = self._clone()
+        clone._thumbnail_prefetches.append((field_name, patterns))
+        return clone
+
+
+class ThumbnailManager(models.Manager):
+
+    """Manager which returns ThumbnailQuerySet"""
+
+    def get_queryset(self):
+        return ThumbnailQuerySet(self.model, using=self._db)
+    # Django < 1.6
+    get_query_set = get_queryset
+
+    def prefetch_thumbnails(self, field_name, patterns=None):
+        return self.get_queryset().prefetch_thumbnails(field_name, patterns)
@@ -0,0 +1,163 @@
+# coding=utf-8
+"""
+Background thumbnail generation queues
+
+When ``asynchronous`` option of ThumbnailField is True, a missing thumbnail
+is not generated while the URL is accessed. Instead a job is enqueued to the
+queue configured with ``THUMBNAILFIELD_QUEUE`` (a dotted path of the queue
+class) and ``THUMBNAILFIELD_QUEUE_OPTIONS`` (a dictionary passed to the
+constructor).
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.db import IntegrityError
+
+from thumbnailfield.conf import settings
+from thumbnailfield.compatibility import import_string
+from thumbnailfield.compatibility import get_model
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseQueue(object):
+
+    """Base class of thumbnail generation queue
+
+    Subclasses have to implement ``enqueue``.
+    """
+
+    def enqueue(self, field_file, name):
+        """enqueue a job to generate the thumbnail named name
+
+        Attribute:
+            field_file -- ThumbnailFieldFile instance
+            name -- A name of thumbnail patterns
+        """
+        raise NotImplementedError
+
+    def generate(self, field_file, name):
+        """generate the thumbnail named name (called by workers)"""
+        # use a fresh field file to prevent sharing caches between threads
+        f = field_file.field.attr_class(
+            field_file.instance, field_file.field, field_file.name)
+        f._get_thumbnail_file(name)
+
+
+class ThreadPoolQueue(BaseQueue):
+
+    """Queue which generates thumbnails in in-process worker threads"""
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pool = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def enqueue(self, field_file, name):
+        key = (field_file.storage, field_file._get_thumbnail_filename(name))
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self.get_pool().apply_async(self._run, (key, field_file, name))
+
+    def _run(self, key, field_file, name):
+        try:
+            self.generate(field_file, name)
+        except Exception:
+            logger.exception('Failed to generate thumbnail %s of %s',
+                             name, field_file.name)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+class DatabaseQueue(BaseQueue):
+
+    """Queue which stores jobs in database
+
+    Jobs are processed by ``thumbnailfield_process_queue`` management
+    command. A job which failed ``max_attempts`` times is marked as failed
+    and kept for inspection instead of being retried forever.
+    """
+
+    def __init__(self, max_attempts=5):
+        self.max_attempts = max_attempts
+
+    def enqueue(self, field_file, name):
+        from thumbnailfield.models import ThumbnailJob
+        instance = field_file.instance
+        if instance.pk is None:
+            raise ValueError(
+                'Thumbnails of unsaved instances cannot be enqueued')
+        opts = instance._meta
+        try:
+            ThumbnailJob.objects.get_or_create(
+                app_label=opts.app_label,
+                model_name=opts.object_name,
+                field_name=field_file.field.name,
+                object_id=str(instance.pk),
+                pattern_name=name or '')
+        except IntegrityError:
+            # the job has been enqueued by another process
+            pass
+
+    def process(self, job):
+        """process a ThumbnailJob and delete it
+
+        Jobs of deleted models and instances are deleted without processing
+        """
+        try:
+            model = get_model(job.app_label, job.model_name)
+        except LookupError:
+            # Django >= 1.7 raises LookupError for unknown models
+            model = None
+        instance = None
+        if model is not None:
+            try:
+                instance = model._default_manager.get(pk=job.object_id)
+            except model.DoesNotExist:
+                pass
+        if instance is not None:
+            field_file = getattr(instance, job.field_name)
+            if field_file:
+                self.generate(field_file, job.pattern_name or None)
+        job.delete()
+
+    def fail(self, job, error):
+        """record the error of a ThumbnailJob which failed
+
+        The job is marked as failed when it has failed ``max_attempts`` times
+        """
+        job.attempts += 1
+        job.last_error = error
+        job.failed = job.attempts >= self.max_attempts
+        job.save()
+
+
+_queue_cache = {}
+
+
+def get_queue():
+    """get queue configured in settings
+
+    Usage::
+        >>> isinstance(get_queue(), ThreadPoolQueue)
+        True
+    """
+    path = settings.THUMBNAILFIELD_QUEUE
+    options = settings.THUMBNAILFIELD_QUEUE_OPTIONS
+    key = (path, repr(sorted(options.items())))
+    if key not in _queue_cache:
+        _queue_cache[key] = import_string(path)(**options)
+    return _queue_cache[key]
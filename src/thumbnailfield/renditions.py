@@ -0,0 +1,255 @@
+# coding=utf-8
+"""
+Signed ad-hoc renditions
+
+An ad-hoc rendition is a thumbnail which is not declared in ``patterns`` of
+ThumbnailField. The source and the process (width, height, method and
+options) are signed into a URL with ``django.core.signing`` thus only URLs
+made by the application are rendered. The process method is looked up from
+``THUMBNAILFIELD_PROCESS_METHOD_TABLE``.
+
+Rendered renditions are not saved to the storage. They are kept in the
+rendition store configured with ``THUMBNAILFIELD_RENDITION_STORE`` (a dotted
+path of the store class) and ``THUMBNAILFIELD_RENDITION_STORE_OPTIONS`` (a
+dictionary passed to the constructor) which evicts rarely requested
+renditions.
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from django.core import signing
+
+from thumbnailfield.conf import settings
+from thumbnailfield.utils import get_content_file
+from thumbnailfield.utils import get_fileformat_from_filename
+from thumbnailfield.utils import get_modified_time
+from thumbnailfield.utils import get_pil_save_options
+from thumbnailfield.utils import get_storage_key
+from thumbnailfield.pipelines import compile_patterns
+from thumbnailfield.compatibility import import_string
+from thumbnailfield.compatibility import get_cache
+from thumbnailfield.compatibility import get_model
+from thumbnailfield.compatibility import reverse
+
+
+SALT = 'thumbnailfield.renditions'
+
+
+class BaseRenditionStore(object):
+
+    """Base class of rendition store
+
+    Subclasses have to implement ``get`` and ``set``. Renditions are
+    encoded bytes.
+    """
+
+    def get(self, key):
+        """return the rendition of key or None"""
+        raise NotImplementedError
+
+    def set(self, key, data):
+        """store the rendition of key"""
+        raise NotImplementedError
+
+
+class LocMemRenditionStore(BaseRenditionStore):
+
+    """In-process rendition store with a byte-size budget, LRU and TTL
+
+    Usage::
+        >>> store = LocMemRenditionStore(max_size=10, timeout=60)
+        >>> store.set('a', b'aaaa')
+        >>> store.set('b', b'bbbb')
+        >>> store.get('a') == b'aaaa'
+        True
+        >>> store.set('c', b'cccc')
+        >>> # 'b' is the least recently used rendition
+        >>> store.get('b') is None
+        True
+        >>> store.size
+        8
+        >>> # expired renditions are not returned
+        >>> store.timeout = 0
+        >>> store.get('a') is None
+        True
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024, timeout=3600):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            data, created = entry
+            if self.timeout is not None and \
+                    time.time() - created >= self.timeout:
+                self.size -= len(data)
+                return None
+            # move the entry to the end
+            self._entries[key] = entry
+            return data
+
+    def set(self, key, data):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[0])
+            if len(data) > self.max_size:
+                return
+            self._entries[key] = (data, time.time())
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class CacheRenditionStore(BaseRenditionStore):
+
+    """Rendition store in Django cache backend
+
+    The renditions are shared between processes when the cache backend is
+    (e.g. memcached evicts least recently used renditions).
+    """
+
+    def __init__(self, cache='default', timeout=3600,
+                 key_prefix='thumbnailfield.rendition'):
+        self.cache = get_cache(cache)
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return self.cache.get('%s:%s' % (self.key_prefix, key))
+
+    def set(self, key, data):
+        self.cache.set('%s:%s' % (self.key_prefix, key), data, self.timeout)
+
+
+_store_cache = {}
+
+
+def get_rendition_store():
+    """get rendition store configured in settings
+
+    Usage::
+        >>> isinstance(get_rendition_store(), LocMemRenditionStore)
+        True
+    """
+    path = settings.THUMBNAILFIELD_RENDITION_STORE
+    options = settings.THUMBNAILFIELD_RENDITION_STORE_OPTIONS
+    key = (path, repr(sorted(options.items())))
+    if key not in _store_cache:
+        _store_cache[key] = import_string(path)(**options)
+    return _store_cache[key]
+
+
+def get_rendition_token(field_file, width, height, method=None,
+                        options=None):
+    """sign the source and the process of field_file into a token
+
+    The process is validated (e.g. unknown method name) before signing.
+
+    Attribute:
+        field_file -- ThumbnailFieldFile instance
+        width -- A width passed to the process method
+        height -- A height passed to the process method
+        method -- A name of the process method
+                  (default = settings.THUMBNAILFIELD_DEFAULT_PROCESS_METHOD)
+        options -- A dictionary of the process method options
+    """
+    method = method or settings.THUMBNAILFIELD_DEFAULT_PROCESS_METHOD
+    options = options or {}
+    # raise errors of the process here rather than in the view
+    compile_patterns(((width, height, method, options),), field_file.field)
+    opts = field_file.instance._meta
+    return signing.dumps({
+        'f': [opts.app_label, opts.object_name.lower(),
+              field_file.field.name],
+        's': field_file.name,
+        'p': [width, height, method, options],
+    }, salt=SALT, compress=True)
+
+
+def get_rendition_url(field_file, width, height, method=None, options=None):
+    """get URL of the signed ad-hoc rendition of field_file
+
+    Attribute:
+        field_file -- ThumbnailFieldFile instance
+        width -- A width passed to the process method
+        height -- A height passed to the process method
+        method -- A name of the process method
+        options -- A dictionary of the process method options
+    """
+    token = get_rendition_token(field_file, width, height, method, options)
+    return reverse('thumbnailfield_rendition', kwargs={'token': token})
+
+
+def load_rendition_token(token):
+    """return (field, source, process) of the token
+
+    ``django.core.signing.BadSignature`` is raised when the token is not
+    signed by this application and LookupError is raised when the field
+    does not exist anymore.
+    """
+    payload = signing.loads(token, salt=SALT)
+    app_label, model_name, field_name = payload['f']
+    model = get_model(app_label, model_name)
+    if model is None:
+        raise LookupError(app_label, model_name)
+    fields = dict((f.name, f) for f in model._meta.fields)
+    if field_name not in fields:
+        raise LookupError(app_label, model_name, field_name)
+    return fields[field_name], payload['s'], tuple(payload['p'])
+
+
+def get_rendition_key(field, source, process):
+    """get a key of the rendition in the rendition store
+
+    The key changes when the source file is modified.
+
+    Attribute:
+        field -- ThumbnailField instance
+        source -- A name of the source file in the storage of the field
+        process -- A tuple of (width, height, method, options)
+    """
+    modified_time = get_modified_time(field.storage, source)
+    key = json.dumps([get_storage_key(field.storage), source,
+                      modified_time and modified_time.isoformat(),
+                      process], sort_keys=True)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def render_rendition(field, source, process, key=None):
+    """render the rendition of source and return the encoded bytes
+
+    The rendition is looked up in the rendition store first. The decoded
+    source is shared through the process-wide image cache.
+
+    Attribute:
+        field -- ThumbnailField instance
+        source -- A name of the source file in the storage of the field
+        process -- A tuple of (width, height, method, options)
+        key -- A key of the rendition (see get_rendition_key)
+    """
+    key = key or get_rendition_key(field, source, process)
+    store = get_rendition_store()
+    data = store.get(key)
+    if data is None:
+        field_file = field.attr_class(None, field, source)
+        pipeline = compile_patterns((process,), field)
+        img = pipeline(field_file._get_image())
+        file_fmt = (get_fileformat_from_filename(source) or
+                    field_file.image_format)
+        data = get_content_file(
+            img, file_fmt,
+            **get_pil_save_options(file_fmt, field.pil_save_options)).read()
+        store.set(key, data)
+    return data
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ThumbnailJob'
+        db.create_table(u'thumbnailfield_thumbnailjob', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('app_label', self.gf('django.db.models.fields.CharField')(max_length=100)),
+            ('model_name', self.gf('django.db.models.fields.CharField')(max_length=100)),
+            ('field_name', self.gf('django.db.models.fields.CharField')(max_length=100)),
+            ('object_id', self.gf('django.db.models.fields.CharField')(max_length=255)),
+            ('pattern_name', self.gf('django.db.models.fields.CharField')(max_length=100, blank=True)),
+            ('created_at', self.gf('django.db.models.fields.DateTimeField')(auto_now_add=True, blank=True)),
+            ('attempts', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('last_error', self.gf('django.db.models.fields.TextField')(default='', blank=True)),
+            ('failed', self.gf('django.db.models.fields.BooleanField')(default=False)),
+        ))
+        db.send_create_signal(u'thumbnailfield', ['ThumbnailJob'])
+
+        # Adding unique constraint on 'ThumbnailJob', fields ['app_label', 'model_name', 'field_name', 'object_id', 'pattern_name']
+        db.create_unique(u'thumbnailfield_thumbnailjob', ['app_label', 'model_name', 'field_name', 'object_id', 'pattern_name'])
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'ThumbnailJob', fields ['app_label', 'model_name', 'field_name', 'object_id', 'pattern_name']
+        db.delete_unique(u'thumbnailfield_thumbnailjob', ['app_label', 'model_name', 'field_name', 'object_id', 'pattern_name'])
+
+        # Deleting model 'ThumbnailJob'
+        db.delete_table(u'thumbnailfield_thumbnailjob')
+
+    models = {
+        u'thumbnailfield.thumbnailjob': {
+            'Meta': {'unique_together': "(('app_label', 'model_name', 'field_name', 'object_id', 'pattern_name'),)", 'object_name': 'ThumbnailJob'},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'created_at': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'failed': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'field_name': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_error': ('django.db.models.fields.TextField', [], {'default': "''", 'blank': 'True'}),
+            'model_name': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'object_id': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'pattern_name': ('django.db.models.fields.CharField', [], {'max_length': '100', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['thumbnailfield']
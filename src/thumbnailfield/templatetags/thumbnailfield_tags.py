@@ -0,0 +1,97 @@
+# coding=utf-8
+"""
+Template tags of ThumbnailField
+
+The output format of thumbnails is chosen with Accept header of ``request``
+in the context (see ThumbnailFieldFile.get_variant_name) thus
+``django.core.context_processors.request`` is required to serve modern
+formats (e.g. WebP). The page depends on Accept header then thus add
+``thumbnailfield.middleware.VaryAcceptMiddleware`` to add ``Vary: Accept``
+to the response.
+
+Usage::
+
+    {% load thumbnailfield_tags %}
+    <img src="{% thumbnail_url entry.thumbnail 'large' %}"
+         srcset="{% thumbnail_srcset entry.thumbnail 'hero' %}"
+         sizes="100vw">
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+from django import template
+
+
+register = template.Library()
+
+
+def _get_accept(context):
+    request = context.get('request')
+    if request is None:
+        return None
+    # the response varies on Accept header (see VaryAcceptMiddleware)
+    request._thumbnailfield_vary_accept = True
+    return request.META.get('HTTP_ACCEPT')
+
+
+class ThumbnailNode(template.Node):
+
+    """Node which renders ``func(context, field_file, name)``
+
+    ``simple_tag(takes_context=True)`` is not available in Django < 1.3
+    """
+
+    def __init__(self, func, field_file, name):
+        self.func = func
+        self.field_file = field_file
+        self.name = name
+
+    def render(self, context):
+        field_file = self.field_file.resolve(context)
+        name = self.name.resolve(context)
+        return self.func(context, field_file, name)
+
+
+def _thumbnail_tag(func):
+    """register func as a tag which takes a field file and a name"""
+    def compile_func(parser, token):
+        bits = token.split_contents()
+        if len(bits) != 3:
+            raise template.TemplateSyntaxError(
+                "'%s' tag takes a field file and a name of patterns" %
+                bits[0])
+        return ThumbnailNode(func,
+                             parser.compile_filter(bits[1]),
+                             parser.compile_filter(bits[2]))
+    register.tag(func.__name__, compile_func)
+    return func
+
+
+@_thumbnail_tag
+def thumbnail_url(context, field_file, name):
+    """render URL of the thumbnail in the best output format
+
+    An empty string is rendered when the field file is empty (see
+    ThumbnailFieldFile.get_variant_url)
+
+    Attribute:
+        field_file -- ThumbnailFieldFile instance
+        name -- A name of thumbnail patterns
+    """
+    if not field_file:
+        return ''
+    return field_file.get_variant_url(name, _get_accept(context))
+
+
+@_thumbnail_tag
+def thumbnail_srcset(context, field_file, name):
+    """render ``srcset`` attribute value of the width ladder of name
+
+    An empty string is rendered when the field file is empty (see
+    ThumbnailFieldFile.srcset)
+
+    Attribute:
+        field_file -- ThumbnailFieldFile instance
+        name -- A name of width ladder in patterns
+    """
+    if not field_file:
+        return ''
+    return field_file.srcset(name, _get_accept(context))
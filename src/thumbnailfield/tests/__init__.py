@@ -6,6 +6,14 @@ list_of_doctests = (
     'thumbnailfield.process_methods',
     'thumbnailfield.utils',
     'thumbnailfield.fields',
+    'thumbnailfield.indexes',
+    'thumbnailfield.queues',
+    'thumbnailfield.parallel',
+    'thumbnailfield.pipelines',
+    'thumbnailfield.cache',
+    'thumbnailfield.locks',
+    'thumbnailfield.probe',
+    'thumbnailfield.renditions',
 )
 list_of_unittests = (
     'thumbnailfield.tests.test_thubmanilfield',
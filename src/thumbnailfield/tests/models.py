@@ -4,6 +4,7 @@
 __author__ = 'Alisue <lambdalisue@hashnote.net>'
 from django.db import models
 from thumbnailfield.fields import ThumbnailField
+from thumbnailfield.query import ThumbnailManager
 
 
 class Entry(models.Model):
@@ -61,5 +62,59 @@ class Entry(models.Model):
             'nothing': None,
         })
 
+    objects = ThumbnailManager()
+
+    class Meta:
+        app_label = 'thumbnailfield'
+
+
+class AsyncEntry(models.Model):
+    thumbnail = ThumbnailField(
+        'thumbnail', upload_to='img/thumbnails', null=True, blank=True,
+        asynchronous=True,
+        patterns={
+            'large': ((640, 480, 'resize'),),
+            'tiny': (160, 120),
+        })
+
+    class Meta:
+        app_label = 'thumbnailfield'
+
+
+class ManifestEntry(models.Model):
+    manifest = models.TextField(blank=True, default='')
+    thumbnail = ThumbnailField(
+        'thumbnail', upload_to='img/thumbnails', null=True, blank=True,
+        manifest_field='manifest',
+        patterns={
+            'small': (320, 240, 'crop', {'left': 0, 'upper': 0}),
+            'tiny': (160, 120),
+        })
+
+    class Meta:
+        app_label = 'thumbnailfield'
+
+
+class LadderEntry(models.Model):
+    thumbnail = ThumbnailField(
+        'thumbnail', upload_to='img/thumbnails', null=True, blank=True,
+        patterns={
+            # 73px wide fixture: 16w, 32w and 64w are generated
+            'hero': {'widths': [16, 32, 64, 128]},
+        })
+
+    class Meta:
+        app_label = 'thumbnailfield'
+
+
+class FormatEntry(models.Model):
+    thumbnail = ThumbnailField(
+        'thumbnail', upload_to='img/thumbnails', null=True, blank=True,
+        patterns={
+            'small': (32, 32, 'crop', {'left': 0, 'upper': 0}),
+        },
+        # AVIF is ignored when the Pillow build cannot save it
+        formats={'small': ['AVIF', 'WEBP']})
+
     class Meta:
         app_label = 'thumbnailfield'
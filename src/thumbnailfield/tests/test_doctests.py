@@ -12,4 +12,12 @@ def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite('thumbnailfield.process_methods'))
     tests.addTests(doctest.DocTestSuite('thumbnailfield.utils'))
     tests.addTests(doctest.DocTestSuite('thumbnailfield.fields'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.indexes'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.queues'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.parallel'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.pipelines'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.cache'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.locks'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.probe'))
+    tests.addTests(doctest.DocTestSuite('thumbnailfield.renditions'))
     return tests
@@ -3,10 +3,29 @@
 """
 __author__ = 'Alisue <lambdalisue@hashnote.net>'
 import os
+import json
+import unittest
+import time
+import tempfile
+import threading
 from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.files.base import File
+from django.core.files.base import ContentFile
 from thumbnailfield.tests.models import Entry
+from thumbnailfield.tests.models import AsyncEntry
+from thumbnailfield.tests.models import ManifestEntry
+from thumbnailfield.tests.models import LadderEntry
+from thumbnailfield.tests.models import FormatEntry
+from thumbnailfield.models import ThumbnailJob
+from thumbnailfield.pipelines import compile_patterns
+from thumbnailfield.query import prefetch_thumbnails
 from thumbnailfield.compatibility import override_settings
+from thumbnailfield.compatibility import Image
+from thumbnailfield.compatibility import ImageChops
+from thumbnailfield.compatibility import StringIO
+from thumbnailfield.compatibility import futures
 
 
 FILENAME = os.path.join(os.path.dirname(__file__), 'data', 'lambdalisue.bmp')
@@ -65,3 +84,897 @@ class ThumbnailFieldTestCase(TestCase):
         thumbnail_test('tiny', 160, 120)
 
         entry.thumbnail.delete()
+
+    def test_thumbnailfield_update_thumbnail_files(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        entry.thumbnail.update_thumbnail_files()
+
+        def thumbnail_test(name, width, height):
+            path = os.path.realpath(
+                entry.thumbnail._get_thumbnail_filename(name))
+            # the file exists without accessing
+            self.assert_(os.path.exists(path))
+            # the size is equal to the size of the non-cascaded thumbnail
+            thumbnail = getattr(entry.thumbnail, name)
+            expected = entry.thumbnail._create_thumbnail(
+                entry.thumbnail.patterns[name])
+            self.assertEqual((thumbnail.width, thumbnail.height),
+                             expected.size)
+            self.assert_(thumbnail.width <= width)
+            self.assert_(thumbnail.height <= height)
+
+        thumbnail_test('large', 640, 480)
+        thumbnail_test('small', 320, 240)
+        thumbnail_test('tiny', 160, 120)
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_jpeg_draft(self):
+
+        buf = StringIO()
+        Image.new('RGB', (1600, 1200)).save(buf, format='JPEG')
+        f = ContentFile(buf.getvalue(), 'test.jpg')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+
+        # tiny (160x80) can be decoded in 1/4 scale (the original is resized
+        # to 800x400 with the original pattern)
+        patterns = entry.thumbnail.patterns['tiny']
+        img = entry.thumbnail._get_draft_image([patterns])
+        self.assertEqual(img.size, (200, 100))
+        # small (crop) requires the original size
+        patterns = entry.thumbnail.patterns['small']
+        img = entry.thumbnail._get_draft_image([patterns])
+        self.assertEqual(img.size, (800, 400))
+
+        # the original is resized to 800x400 with the original pattern and
+        # the cached decode is used instead of the draft once it is cached
+        self.assertEqual(entry.thumbnail._get_image().size, (800, 400))
+        patterns = entry.thumbnail.patterns['tiny']
+        img = entry.thumbnail._get_draft_image([patterns])
+        self.assert_(img is entry.thumbnail._get_image())
+
+        self.assertEqual(entry.thumbnail.tiny.width, 160)
+        self.assertEqual(entry.thumbnail.tiny.height, 80)
+
+        entry.thumbnail.delete()
+
+    @override_settings(
+        THUMBNAILFIELD_EXISTENCE_INDEX=(
+            'thumbnailfield.indexes.LocMemExistenceIndex'),
+    )
+    def test_thumbnailfield_existence_index(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        path = entry.thumbnail.large_path
+        self.assert_(os.path.exists(path))
+
+        # the storage is not asked while the index knows the file
+        entry = Entry.objects.get(pk=entry.pk)
+        storage = entry.thumbnail.storage
+        storage.exists = lambda name: self.fail('storage.exists is called')
+        try:
+            self.assertEqual(entry.thumbnail.large_path, path)
+        finally:
+            del storage.exists
+
+        entry.thumbnail.delete()
+
+    @override_settings(
+        THUMBNAILFIELD_QUEUE='thumbnailfield.queues.DatabaseQueue',
+        THUMBNAILFIELD_PLACEHOLDER_URL='/static/placeholder.png',
+    )
+    def test_thumbnailfield_asynchronous(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = AsyncEntry.objects.create(thumbnail=f)
+        path = os.path.realpath(
+            entry.thumbnail._get_thumbnail_filename('large'))
+
+        # the placeholder is returned and a job is enqueued
+        self.assertEqual(entry.thumbnail.large_url, '/static/placeholder.png')
+        self.assertEqual(entry.thumbnail.large_url, '/static/placeholder.png')
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+        self.assert_(not os.path.exists(path))
+
+        # the job is processed by the management command
+        call_command('thumbnailfield_process_queue', verbosity=0)
+        self.assertEqual(ThumbnailJob.objects.count(), 0)
+        self.assert_(os.path.exists(path))
+        entry = AsyncEntry.objects.get(pk=entry.pk)
+        self.assert_(entry.thumbnail.large_url.endswith('test.large.bmp'))
+
+        entry.thumbnail.delete()
+
+    @override_settings(
+        THUMBNAILFIELD_QUEUE='thumbnailfield.queues.DatabaseQueue',
+        THUMBNAILFIELD_PLACEHOLDER_URL='/static/placeholder.png',
+    )
+    def test_thumbnailfield_asynchronous_failure(self):
+        from thumbnailfield.queues import DatabaseQueue
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = AsyncEntry.objects.create(thumbnail=f)
+        f = File(open(FILENAME, 'rb'), 'broken.bmp')
+        broken = AsyncEntry.objects.create(thumbnail=f)
+        with open(broken.thumbnail.path, 'wb') as fo:
+            fo.write(b'not an image')
+        # the job of the broken image comes first
+        ThumbnailJob.objects.create(app_label='thumbnailfield',
+                                    model_name='asyncentry',
+                                    field_name='thumbnail',
+                                    object_id=str(broken.pk))
+        self.assertEqual(entry.thumbnail.large_url, '/static/placeholder.png')
+        path = os.path.realpath(
+            entry.thumbnail._get_thumbnail_filename('large'))
+
+        # the failed job is recorded and does not block the other job
+        try:
+            from django.utils.six import StringIO as TextIO
+        except ImportError:
+            from StringIO import StringIO as TextIO
+        stderr = TextIO()
+        call_command('thumbnailfield_process_queue', verbosity=0,
+                     stderr=stderr)
+        self.assert_('Failed to process job' in stderr.getvalue())
+        self.assert_(os.path.exists(path))
+        job = ThumbnailJob.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assert_(job.last_error)
+        self.assert_(not job.failed)
+
+        # the job is kept as failed after max_attempts
+        queue = DatabaseQueue(max_attempts=2)
+        queue.fail(job, 'error')
+        job = ThumbnailJob.objects.get()
+        self.assert_(job.failed)
+        call_command('thumbnailfield_process_queue', verbosity=0)
+        self.assertEqual(ThumbnailJob.objects.get().attempts, 2)
+
+        # unsaved instances cannot be enqueued
+        unsaved = AsyncEntry(thumbnail='thumbnails/unsaved.bmp')
+        self.assertRaises(ValueError, queue.enqueue, unsaved.thumbnail, None)
+
+        entry = AsyncEntry.objects.get(pk=entry.pk)
+        self.assert_(entry.thumbnail.large_url.endswith('test.large.bmp'))
+        entry.thumbnail.delete()
+        broken.thumbnail.delete()
+
+    @unittest.skipIf(futures is None, "'futures' package is not installed")
+    def test_thumbnailfield_process_pool(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        executor = futures.ProcessPoolExecutor(1)
+        try:
+            entry.thumbnail.update_thumbnail_files(executor=executor)
+        finally:
+            executor.shutdown()
+
+        def thumbnail_test(name, width, height):
+            path = os.path.realpath(
+                entry.thumbnail._get_thumbnail_filename(name))
+            self.assert_(os.path.exists(path))
+            thumbnail = getattr(entry.thumbnail, name)
+            self.assertEqual(thumbnail.path, path)
+            self.assert_(thumbnail.width <= width)
+            self.assert_(thumbnail.height <= height)
+
+        thumbnail_test('large', 640, 480)
+        thumbnail_test('small', 320, 240)
+        thumbnail_test('tiny', 160, 120)
+
+        entry.thumbnail.delete()
+
+    @unittest.skipIf(futures is None, "'futures' package is not installed")
+    def test_thumbnailfield_process_pool_submission(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        events = []
+
+        class Executor(futures.ThreadPoolExecutor):
+            def submit(self, fn, *args, **kwargs):
+                events.append('submit')
+                future = super(Executor, self).submit(fn, *args, **kwargs)
+                result = future.result
+
+                def _result(*args, **kwargs):
+                    events.append('result')
+                    return result(*args, **kwargs)
+                future.result = _result
+                return future
+
+        executor = Executor(2)
+        try:
+            # 'small' (crop) and None (sepia) cannot share a render
+            thumbnails = entry.thumbnail._render_thumbnails(
+                [None, 'small'], executor)
+        finally:
+            executor.shutdown()
+        self.assertEqual(sorted(thumbnails, key=str), [None, 'small'])
+        # every group is submitted before any result is waited
+        self.assertEqual(events, ['submit', 'submit', 'result', 'result'])
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_rebuild_command(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry1 = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        f = File(open(FILENAME, 'rb'), 'test2.bmp')
+        entry2 = Entry.objects.create(title='hoge', body='bar', thumbnail=f)
+
+        def exists(entry, name):
+            path = entry.thumbnail._get_thumbnail_filename(name)
+            return os.path.exists(os.path.realpath(path))
+
+        fd, checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(checkpoint)
+        try:
+            call_command('thumbnailfield_rebuild',
+                         'thumbnailfield.Entry.thumbnail',
+                         patterns='large,tiny', workers=2, chunk_size=1,
+                         checkpoint=checkpoint, verbosity=0)
+            for entry in (entry1, entry2):
+                self.assert_(exists(entry, 'large'))
+                self.assert_(exists(entry, 'tiny'))
+                self.assert_(not exists(entry, 'small'))
+            with open(checkpoint) as fi:
+                self.assertEqual(int(fi.read()), entry2.pk)
+
+            # resume from entry1 (the primary key is given as a string)
+            call_command('thumbnailfield_rebuild',
+                         'thumbnailfield.Entry.thumbnail',
+                         only_missing=True, resume_from=str(entry1.pk),
+                         verbosity=0)
+            self.assertRaises(CommandError, call_command,
+                              'thumbnailfield_rebuild',
+                              'thumbnailfield.Entry.thumbnail',
+                              resume_from='foo', verbosity=0)
+            self.assert_(not exists(entry1, 'small'))
+            self.assert_(exists(entry2, 'small'))
+        finally:
+            os.remove(checkpoint)
+
+        # width ladders are expanded into the rungs
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        ladder = LadderEntry.objects.create(thumbnail=f)
+        call_command('thumbnailfield_rebuild',
+                     'thumbnailfield.LadderEntry.thumbnail',
+                     patterns='hero', verbosity=0)
+        self.assert_(exists(ladder, 'hero_16w'))
+        self.assert_(exists(ladder, 'hero_64w'))
+        self.assertRaises(CommandError, call_command,
+                          'thumbnailfield_rebuild',
+                          'thumbnailfield.LadderEntry.thumbnail',
+                          patterns='unknown', verbosity=0)
+
+        # the thumbnails are generated by the command thus they are not
+        # cached on the instances
+        for entry in (entry1, entry2, ladder):
+            for filename in entry.thumbnail.get_thumbnail_filenames():
+                entry.thumbnail.storage.delete(filename)
+            entry.thumbnail.delete()
+
+    @override_settings(
+        THUMBNAILFIELD_FILENAME_PATTERN=(
+            r'%(root)s/%(filename)s.%(name)s.%(hash)s.%(ext)s'),
+    )
+    def test_thumbnailfield_pattern_fingerprint(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        path = entry.thumbnail.large_path
+
+        # the filename is changed when the pattern has changed
+        pipelines = entry.thumbnail.pipelines
+        large = pipelines['large']
+        pipelines['large'] = compile_patterns(((800, 600, 'resize'),))
+        try:
+            self.assertNotEqual(entry.thumbnail._get_thumbnail_filename(
+                'large'), entry.thumbnail.large.name)
+        finally:
+            pipelines['large'] = large
+        self.assertEqual(os.path.realpath(
+            entry.thumbnail._get_thumbnail_filename('large')), path)
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_pipeline_optimization(self):
+
+        img = Image.open(FILENAME)
+        img.load()
+        patterns = ((400, 300, 'crop', {'left': 10, 'upper': 20}),
+                    (None, None, 'grayscale'),
+                    (160, 120, 'resize'))
+        pipeline = compile_patterns(patterns)
+        self.assertEqual([s.method_name for s in pipeline.plan],
+                         ['crop+resize', 'grayscale'])
+
+        # the optimized result is equal to the sequential result
+        expected = img.crop((10, 20, 410, 320))
+        expected = expected.convert('L')
+        expected = expected.resize((160, 120), Image.ANTIALIAS)
+        processed = pipeline(img)
+        self.assertEqual(processed.size, expected.size)
+        self.assertEqual(processed.mode, expected.mode)
+        # rounding differences only
+        difference = ImageChops.difference(processed, expected)
+        self.assert_(max(difference.getdata()) <= 8)
+
+    def test_thumbnailfield_thumbnail_resample(self):
+
+        img = Image.open(FILENAME)
+        img.load()
+        # the result is equal to PIL thumbnail method
+        expected = img.copy()
+        expected.thumbnail((40, 40))
+        processed = compile_patterns((40, 40, 'thumbnail', {}))(img)
+        self.assertEqual(processed.size, expected.size)
+        self.assertEqual(ImageChops.difference(processed, expected).getbbox(),
+                         None)
+
+    def test_thumbnailfield_pipeline_ownership(self):
+
+        img = Image.open(FILENAME)
+        img.load()
+        original = img.copy()
+
+        # a process method which returns the given image as it is
+        def noop(img, width, height, **options):
+            return img
+
+        pipeline = compile_patterns(((None, None, noop), (40, 40)))
+        processed = pipeline(img)
+        self.assertEqual(processed.size, (40, 40))
+        # the source image is not modified in place
+        self.assertEqual(img.size, original.size)
+        self.assertEqual(ImageChops.difference(img, original).getbbox(),
+                         None)
+
+    def test_thumbnailfield_pipeline_reorder_modes(self):
+
+        img = Image.open(FILENAME).convert('P')
+        patterns = ((None, None, 'grayscale'), (40, 30, 'resize'))
+        pipeline = compile_patterns(patterns)
+        # steps are not reordered for P images
+        expected = img.convert('L').resize((40, 30), Image.ANTIALIAS)
+        processed = pipeline(img)
+        self.assertEqual(ImageChops.difference(processed, expected).getbbox(),
+                         None)
+
+        # sepia is never reordered
+        pipeline = compile_patterns(((None, None, 'sepia'), (40, 30)))
+        self.assertEqual([s.method_name for s in pipeline.plan],
+                         ['sepia', 'thumbnail'])
+
+    def test_thumbnailfield_image_cache(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+
+        # decoded images are shared between instances
+        entry1 = Entry.objects.get(pk=entry.pk)
+        entry2 = Entry.objects.get(pk=entry.pk)
+        self.assert_(entry1.thumbnail._get_image() is
+                     entry2.thumbnail._get_image())
+        self.assert_(entry1.thumbnail._get_thumbnail('tiny') is
+                     entry2.thumbnail._get_thumbnail('tiny'))
+
+        # the cache is bounded
+        with override_settings(THUMBNAILFIELD_IMAGE_CACHE_SIZE=0):
+            self.assert_(entry1.thumbnail._get_image() is not
+                         entry2.thumbnail._get_image())
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_deterministic_filename(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        directory = os.path.dirname(entry.thumbnail.path)
+
+        def duplicates():
+            return [n for n in os.listdir(directory)
+                    if n.startswith('test.small_')]
+
+        # updating thumbnails overwrites the existing files
+        entry.thumbnail.update_thumbnail_files()
+        entry.thumbnail.update_thumbnail_files()
+        self.assertEqual(duplicates(), [])
+
+        # concurrent first accesses render the thumbnail only once
+        entry.thumbnail.storage.delete(
+            entry.thumbnail._get_thumbnail_filename('small'))
+        renders = []
+        cls = type(entry.thumbnail)
+        get_thumbnail = cls._get_thumbnail
+
+        def _get_thumbnail(self, name, force=False):
+            renders.append(name)
+            return get_thumbnail(self, name, force)
+
+        entries = [Entry.objects.get(pk=entry.pk) for i in range(4)]
+        cls._get_thumbnail = _get_thumbnail
+        try:
+            threads = [threading.Thread(target=lambda e=e: e.thumbnail.small)
+                       for e in entries]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            cls._get_thumbnail = get_thumbnail
+        self.assertEqual(renders, ['small'])
+        self.assertEqual(duplicates(), [])
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_file_lock_stripes(self):
+        import shutil
+        from thumbnailfield.locks import FileLock
+        from django.core.files.storage import default_storage
+
+        lock_dir = tempfile.mkdtemp()
+        try:
+            lock = FileLock(lock_dir=lock_dir, stripes=4)
+            names = ['test%d.small.bmp' % i for i in range(32)]
+            for name in names:
+                with lock(default_storage, name):
+                    pass
+            # the lock files are bounded by the number of stripes
+            self.assert_(0 < len(os.listdir(lock_dir)) <= 4)
+            self.assertEqual(lock.get_path(default_storage, names[0]),
+                             lock.get_path(default_storage, names[0]))
+        finally:
+            shutil.rmtree(lock_dir)
+
+    def test_thumbnailfield_single_flight(self):
+        from thumbnailfield.cache import get_single_flight
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+
+        renders = []
+        waiting = []
+        started = threading.Event()
+        release = threading.Event()
+        cls = type(entry.thumbnail)
+        create_thumbnail = cls._create_thumbnail
+
+        def _create_thumbnail(self, patterns):
+            renders.append(patterns)
+            # keep the render in flight until the other threads are waiting
+            started.set()
+            release.wait()
+            return create_thumbnail(self, patterns)
+
+        class WaitingEvent(object):
+            """record the threads which wait the flight"""
+            def __init__(self, event):
+                self.event = event
+
+            def wait(self):
+                waiting.append(threading.current_thread())
+                return self.event.wait()
+
+            def set(self):
+                self.event.set()
+
+        entries = [Entry.objects.get(pk=entry.pk) for i in range(4)]
+        results = []
+        cls._create_thumbnail = _create_thumbnail
+        try:
+            # the image cache is disabled to observe the single flight only
+            with override_settings(THUMBNAILFIELD_IMAGE_CACHE_SIZE=0):
+                threads = [threading.Thread(
+                    target=lambda e=e: results.append(
+                        e.thumbnail._get_thumbnail('tiny')))
+                    for e in entries]
+                # the first thread becomes the leader of the flight
+                threads[0].start()
+                started.wait()
+                flight = list(get_single_flight()._flights.values())[0]
+                flight.event = WaitingEvent(flight.event)
+                for thread in threads[1:]:
+                    thread.start()
+                deadline = time.time() + 10
+                while len(waiting) < 3 and time.time() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(len(waiting), 3)
+                release.set()
+                for thread in threads:
+                    thread.join()
+        finally:
+            release.set()
+            cls._create_thumbnail = create_thumbnail
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(len(results), 4)
+        self.assert_(all(r is results[0] for r in results))
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_prefetch_thumbnails(self):
+
+        for i in range(3):
+            f = File(open(FILENAME, 'rb'), 'test%d.bmp' % i)
+            Entry.objects.create(title='foo%d' % i, body='bar', thumbnail=f)
+
+        exists_calls = []
+        storage = Entry._meta.get_field('thumbnail').storage
+        exists = storage.exists
+
+        def _exists(name):
+            exists_calls.append(name)
+            return exists(name)
+
+        storage.exists = _exists
+        try:
+            # missing thumbnails are generated while prefetching
+            entries = prefetch_thumbnails(Entry.objects.all(), 'thumbnail',
+                                          patterns=['small', 'tiny'])
+            for entry in entries:
+                self.assert_(os.path.exists(entry.thumbnail.small.path))
+                self.assert_(os.path.exists(entry.thumbnail.tiny.path))
+            # existing thumbnails are found with a directory listing
+            del exists_calls[:]
+            entries = list(Entry.objects.prefetch_thumbnails(
+                'thumbnail', ['small', 'tiny']))
+            for entry in entries:
+                self.assert_(entry.thumbnail.small_url)
+                self.assert_(entry.thumbnail.tiny_url)
+            self.assertEqual(exists_calls, [])
+        finally:
+            del storage.exists
+
+        for entry in entries:
+            entry.thumbnail.delete()
+
+    def test_thumbnailfield_accessors(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        async_entry = AsyncEntry(thumbnail=entry.thumbnail.name)
+
+        self.assertEqual(entry.thumbnail.tiny_path, entry.thumbnail.tiny.path)
+        self.assertEqual(entry.thumbnail.tiny_url, entry.thumbnail.tiny.url)
+        self.assertEqual(entry.thumbnail.tiny_size, entry.thumbnail.tiny.size)
+        # accessors are not added to the class thus do not leak to the field
+        # files of the other models
+        self.assert_(not hasattr(type(entry.thumbnail), 'tiny'))
+        self.assert_(not hasattr(async_entry.thumbnail, 'small'))
+        self.assert_(not hasattr(entry.thumbnail, 'tiny_unknown'))
+        self.assert_(not hasattr(entry.thumbnail, '_tiny_url'))
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_save_without_original_pattern(self):
+
+        with open(FILENAME, 'rb') as fi:
+            data = fi.read()
+        decodes = []
+        cls = AsyncEntry._meta.get_field('thumbnail').attr_class
+        get_thumbnail = cls._get_thumbnail
+
+        def _get_thumbnail(self, name, force=False):
+            decodes.append(name)
+            return get_thumbnail(self, name, force)
+
+        cls._get_thumbnail = _get_thumbnail
+        try:
+            f = File(open(FILENAME, 'rb'), 'test.bmp')
+            entry = AsyncEntry.objects.create(thumbnail=f)
+        finally:
+            cls._get_thumbnail = get_thumbnail
+        # the upload is stored without decoding and re-encoding
+        self.assertEqual(decodes, [])
+        with open(entry.thumbnail.path, 'rb') as fi:
+            self.assertEqual(fi.read(), data)
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_dimension_probe(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        entry = Entry.objects.get(pk=entry.pk)
+
+        opened = []
+        image_open = Image.open
+
+        def _open(*args, **kwargs):
+            opened.append(args)
+            return image_open(*args, **kwargs)
+
+        Image.open = _open
+        try:
+            # the dimensions and the format are read from the headers
+            size = (entry.thumbnail.width, entry.thumbnail.height)
+            self.assertEqual(entry.thumbnail.image_format, 'BMP')
+        finally:
+            Image.open = image_open
+        self.assertEqual(opened, [])
+        self.assertEqual(size, Image.open(entry.thumbnail.path).size)
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_identity(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        entry = Entry.objects.get(pk=entry.pk)
+        # the original (73x73) already fits in 'large' and 'tiny'
+        self.assert_(entry.thumbnail._is_identity('large'))
+        self.assert_(entry.thumbnail._is_identity('tiny'))
+        self.assert_(not entry.thumbnail._is_identity('small'))
+
+        opened = []
+        image_open = Image.open
+
+        def _open(*args, **kwargs):
+            opened.append(args)
+            return image_open(*args, **kwargs)
+
+        Image.open = _open
+        try:
+            large = entry.thumbnail.large
+            entry.thumbnail.update_thumbnail_files(names=['tiny'])
+        finally:
+            Image.open = image_open
+        # the stored bytes are used without decoding and encoding
+        self.assertEqual(opened, [])
+        with open(entry.thumbnail.path, 'rb') as fi:
+            data = fi.read()
+        for path in (large.path, entry.thumbnail.tiny.path):
+            with open(path, 'rb') as fi:
+                self.assertEqual(fi.read(), data)
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_manifest(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = ManifestEntry.objects.create(thumbnail=f)
+        small = entry.thumbnail.small
+        tiny = entry.thumbnail.tiny
+
+        # the manifest is stored to the database
+        entry = ManifestEntry.objects.get(pk=entry.pk)
+        manifest = json.loads(entry.manifest)
+        self.assertEqual(manifest['source'], entry.thumbnail.name)
+        self.assertEqual(sorted(manifest['thumbnails']), ['small', 'tiny'])
+        self.assertEqual(manifest['thumbnails']['small']['format'], 'BMP')
+
+        # accessors are answered from the manifest without I/O
+        storage = entry.thumbnail.storage
+        expected = (small.url, small.size, small.width, small.height,
+                    tiny.size)
+
+        def _io(*args, **kwargs):
+            raise AssertionError('storage must not be accessed')
+
+        for attr in ('exists', 'size', 'open'):
+            setattr(storage, attr, _io)
+        try:
+            self.assertEqual((entry.thumbnail.small_url,
+                              entry.thumbnail.small_size,
+                              entry.thumbnail.small.width,
+                              entry.thumbnail.small.height,
+                              entry.thumbnail.tiny_size), expected)
+            self.assertEqual(list(entry.thumbnail.iter_thumbnail_filenames()),
+                             list(entry.thumbnail.get_thumbnail_filenames()))
+        finally:
+            for attr in ('exists', 'size', 'open'):
+                delattr(storage, attr)
+
+        # prefetch is answered from the manifest without I/O
+        entry = ManifestEntry.objects.get(pk=entry.pk)
+        for attr in ('exists', 'listdir'):
+            setattr(storage, attr, _io)
+        try:
+            prefetch_thumbnails([entry], 'thumbnail', ['small', 'tiny'])
+        finally:
+            for attr in ('exists', 'listdir'):
+                delattr(storage, attr)
+        self.assertEqual(entry.thumbnail._thumbnail_file_small_cache.name,
+                         small.name)
+
+        # concurrent writers with stale manifests do not lose the entries
+        entry = ManifestEntry.objects.get(pk=entry.pk)
+        entry.thumbnail.remove_thumbnail_files(save=False)
+        first = ManifestEntry.objects.get(pk=entry.pk)
+        second = ManifestEntry.objects.get(pk=entry.pk)
+        first.thumbnail.small
+        second.thumbnail.tiny
+        entry = ManifestEntry.objects.get(pk=entry.pk)
+        self.assertEqual(sorted(json.loads(entry.manifest)['thumbnails']),
+                         ['small', 'tiny'])
+        self.assertEqual(second.manifest, entry.manifest)
+
+        # removing thumbnails removes the manifest entries
+        entry = ManifestEntry.objects.get(pk=entry.pk)
+        entry.thumbnail.remove_thumbnail_files(save=False)
+        self.assert_(not os.path.exists(small.path))
+        entry = ManifestEntry.objects.get(pk=entry.pk)
+        self.assertEqual(json.loads(entry.manifest)['thumbnails'], {})
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_serve_thumbnail(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        path = os.path.realpath(
+            entry.thumbnail._get_thumbnail_filename('small'))
+
+        # the URL is available without generating the thumbnail
+        url = entry.thumbnail.small_serve_url
+        self.assert_(not os.path.exists(path))
+
+        # the thumbnail is generated on the request
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/bmp')
+        self.assert_('max-age=' in response['Cache-Control'])
+        with open(path, 'rb') as fi:
+            self.assertEqual(b''.join(response.streaming_content), fi.read())
+
+        # conditional requests
+        response2 = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response2.status_code, 304)
+        response2 = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response2.status_code, 304)
+        response2 = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response2.status_code, 200)
+
+        # unknown models, patterns and files are not served
+        self.assertEqual(self.client.get(
+            url.replace('/thumbnailfield/', '/unknown/')).status_code, 404)
+        self.assertEqual(self.client.get(
+            url.replace('/entry/', '/unknown/')).status_code, 404)
+        self.assertEqual(self.client.get(
+            url.replace('/small/', '/unknown/')).status_code, 404)
+        basename = os.path.basename(entry.thumbnail.name)
+        self.assertEqual(self.client.get(
+            url.replace(basename, 'unknown.bmp')).status_code, 404)
+
+        # the thumbnail is generated by the view thus it is not cached on
+        # the instance
+        entry.thumbnail.storage.delete(
+            entry.thumbnail._get_thumbnail_filename('small'))
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_serve_rendition(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+
+        directory = os.path.dirname(entry.thumbnail.path)
+        files = sorted(os.listdir(directory))
+        url = entry.thumbnail.get_rendition_url(32, 16, 'resize')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/bmp')
+        img = Image.open(StringIO(response.content))
+        self.assertEqual(img.size, (32, 16))
+        # nothing is saved to the storage
+        self.assertEqual(sorted(os.listdir(directory)), files)
+
+        # conditional request
+        response2 = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response2.status_code, 304)
+
+        # tampered tokens are not served
+        self.assertEqual(self.client.get(url[:-2] + 'xx').status_code, 404)
+        # unknown process methods are rejected when the URL is made
+        self.assertRaises(AttributeError, entry.thumbnail.get_rendition_url,
+                          32, 16, 'unknown')
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_srcset(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = LadderEntry.objects.create(thumbnail=f)
+        thumbnail = entry.thumbnail
+        self.assertEqual(sorted(thumbnail.get_pattern_names()),
+                         [None, 'hero_128w', 'hero_16w', 'hero_32w',
+                          'hero_64w'])
+
+        srcset = thumbnail.srcset('hero')
+        self.assertEqual(srcset, ', '.join((
+            '%s 16w' % thumbnail.hero_16w_url,
+            '%s 32w' % thumbnail.hero_32w_url,
+            '%s 64w' % thumbnail.hero_64w_url,
+            '%s 73w' % thumbnail.url,
+        )))
+        self.assertEqual(thumbnail.hero_32w.width, 32)
+        # rungs are resampled with the default process options
+        self.assertEqual(thumbnail.pipelines['hero_32w'].steps[0].options,
+                         {'resample': Image.ANTIALIAS})
+        # the rung larger than the original is never written
+        self.assertEqual(thumbnail.hero_128w_url, thumbnail.url)
+        thumbnail.update_thumbnail_files()
+        self.assert_(not os.path.exists(
+            thumbnail.storage.path(
+                thumbnail._get_thumbnail_filename('hero_128w'))))
+
+        # template tag
+        from django.template import Template, Context
+        template = Template("{% load thumbnailfield_tags %}"
+                            "{% thumbnail_srcset entry.thumbnail 'hero' %}")
+        entry = LadderEntry.objects.get(pk=entry.pk)
+        self.assertEqual(template.render(Context({'entry': entry})), srcset)
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_formats(self):
+
+        f = File(open(FILENAME, 'rb'), 'test.bmp')
+        entry = FormatEntry.objects.create(thumbnail=f)
+        thumbnail = entry.thumbnail
+        self.assert_('small_webp' in thumbnail.get_pattern_names())
+
+        # the variant is chosen with Accept header
+        accept = 'image/webp,image/*,*/*;q=0.8'
+        if 'small_avif' not in thumbnail.patterns:
+            self.assertEqual(thumbnail.get_variant_name('small', accept),
+                             'small_webp')
+        self.assertEqual(thumbnail.get_variant_name('small', '*/*'), 'small')
+        self.assertEqual(thumbnail.get_variant_name('small'), 'small')
+        url = thumbnail.get_variant_url('small', 'image/webp')
+        self.assert_(url.endswith('.webp'))
+        self.assertEqual(Image.open(thumbnail.small_webp.path).format,
+                         'WEBP')
+        self.assertEqual(Image.open(thumbnail.small.path).format, 'BMP')
+
+        # the view negotiates the format
+        response = self.client.get(thumbnail.small_serve_url,
+                                   HTTP_ACCEPT='image/webp')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assert_('Accept' in response['Vary'])
+        response2 = self.client.get(thumbnail.small_serve_url,
+                                    HTTP_ACCEPT='*/*')
+        self.assertEqual(response2['Content-Type'], 'image/bmp')
+        self.assertNotEqual(response['ETag'], response2['ETag'])
+
+        # template tag
+        from django.template import Template, Context
+        from django.test.client import RequestFactory
+        template = Template("{% load thumbnailfield_tags %}"
+                            "{% thumbnail_url entry.thumbnail 'small' %}")
+        request = RequestFactory().get('/', HTTP_ACCEPT='image/webp')
+        self.assertEqual(template.render(Context({
+            'entry': entry, 'request': request})), url)
+        self.assertEqual(template.render(Context({'entry': entry})),
+                         thumbnail.small_url)
+
+        # the page rendered with Accept header varies on Accept header
+        from django.http import HttpResponse
+        from thumbnailfield.middleware import VaryAcceptMiddleware
+        middleware = VaryAcceptMiddleware()
+        response = middleware.process_response(request, HttpResponse())
+        self.assert_('Accept' in response['Vary'])
+        response = middleware.process_response(
+            RequestFactory().get('/'), HttpResponse())
+        self.assert_(not response.has_header('Vary'))
+
+        entry.thumbnail.delete()
+
+    def test_thumbnailfield_without_extension(self):
+
+        # the format is sniffed from the content
+        f = File(open(FILENAME, 'rb'), 'test')
+        entry = Entry.objects.create(title='foo', body='bar', thumbnail=f)
+        self.assertEqual(entry.thumbnail.image_format, 'BMP')
+        self.assert_(entry.thumbnail.small.name.endswith('.bmp'))
+        self.assertEqual(Image.open(entry.thumbnail.small.path).format,
+                         'BMP')
+
+        entry.thumbnail.delete()
@@ -0,0 +1,27 @@
+# coding=utf-8
+"""
+URLconf of ThumbnailField
+
+Usage::
+
+    urlpatterns = patterns('',
+        url(r'^thumbnails/', include('thumbnailfield.urls')),
+    )
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+try:
+    from django.conf.urls import url
+except ImportError:
+    from django.conf.urls.defaults import url
+
+from thumbnailfield.views import serve_thumbnail
+from thumbnailfield.views import serve_rendition
+
+
+urlpatterns = [
+    url(r'^renditions/(?P<token>[\w:.-]+)$',
+        serve_rendition, name='thumbnailfield_rendition'),
+    url(r'^(?P<app_label>\w+)/(?P<model_name>\w+)/(?P<field_name>\w+)/'
+        r'(?P<pattern>[\w-]+)/(?P<source>.+)$',
+        serve_thumbnail, name='thumbnailfield_serve'),
+]
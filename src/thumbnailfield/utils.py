@@ -3,11 +3,21 @@
 Utilities of ThumbnailField
 """
 __author__ = "Alisue <lambdalisue@hashnote.net>"
+import io
 import os
+import uuid
+import hashlib
+import tempfile
+from django.core.files.base import File
 from django.core.files.base import ContentFile
-
+from django.conf import settings as django_settings
 from thumbnailfield.conf import settings
+from thumbnailfield.compatibility import replace
+from thumbnailfield.compatibility import setting_changed
+from thumbnailfield.compatibility import Image
 from thumbnailfield.compatibility import StringIO
+from thumbnailfield.pipelines import compile_patterns
+from thumbnailfield.probe import get_image_format
 
 
 def get_content_file(img, file_fmt, **kwargs):
@@ -31,7 +41,55 @@ def get_content_file(img, file_fmt, **kwargs):
     return ContentFile(file_obj.getvalue())
 
 
-def save_to_storage(img, storage, filename, overwrite=False, **kwargs):
+class _SpooledTemporaryFile(tempfile.SpooledTemporaryFile):
+    # PIL calls fileno() to write to the file descriptor directly but it
+    # makes SpooledTemporaryFile roll over to disk even for small images
+    def fileno(self):
+        if not self._rolled:
+            raise io.UnsupportedOperation('fileno')
+        return tempfile.SpooledTemporaryFile.fileno(self)
+
+
+def get_spooled_file(img, file_fmt, **kwargs):
+    """get File of the encoded PIL image instance with file_fmt
+
+    The image is encoded into a spooled temporary file which is kept in
+    memory until it exceeds settings.THUMBNAILFIELD_SPOOL_MAX_SIZE and
+    written to disk after that. Unlike get_content_file, the encoded image
+    is not copied into a bytes object.
+
+    Attributes:
+        img -- PIL Image instance
+        file_fmt -- Saved image format (PNG, JPEG, ...)
+        kwargs -- Options used in PIL image save method
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> img = Image.new('RGBA', (100, 100))
+        >>> f = get_spooled_file(img, 'PNG')
+        >>> assert f.size > 0
+        >>> assert f.read(4) == b'\x89PNG'
+        >>> f.close()
+        >>> # large image is written to disk
+        >>> from thumbnailfield.compatibility import override_settings
+        >>> with override_settings(THUMBNAILFIELD_SPOOL_MAX_SIZE=10):
+        ...     f = get_spooled_file(img, 'PNG')
+        >>> assert f.file._rolled
+        >>> assert f.read(4) == b'\x89PNG'
+        >>> f.close()
+    """
+    file_obj = _SpooledTemporaryFile(
+        max_size=settings.THUMBNAILFIELD_SPOOL_MAX_SIZE)
+    img.save(file_obj, format=file_fmt, **kwargs)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    f = File(file_obj)
+    f.size = size
+    return f
+
+
+def save_to_storage(img, storage, filename, overwrite=False, atomic=False,
+                    **kwargs):
     """save PIL image instance to Django storage with filename
 
     Attributes:
@@ -39,6 +97,8 @@ def save_to_storage(img, storage, filename, overwrite=False, **kwargs):
         storage -- Django storage instance
         filename -- filename
         overwrite -- If true, delete existing file first
+        atomic -- If true, replace existing file atomically (see
+                  save_content_to_storage)
         kwargs -- Options used in PIL image save method
 
     Usage::
@@ -59,16 +119,151 @@ def save_to_storage(img, storage, filename, overwrite=False, **kwargs):
         >>> # overwrite the file
         >>> filename_ = save_to_storage(img, storage, filename, overwrite=True)
         >>> assert filename == filename_
+        >>> # replace the file atomically
+        >>> filename_ = save_to_storage(img, storage, filename, atomic=True)
+        >>> assert filename == filename_
         >>> storage.delete(filename)
     """
-    file_fmt = get_fileformat_from_filename(filename)
-    content_file = get_content_file(img, file_fmt, **kwargs)
+    file_fmt = get_fileformat_from_filename(filename) or img.format
+    content_file = get_spooled_file(img, file_fmt, **kwargs)
+    try:
+        return save_content_to_storage(content_file, storage, filename,
+                                       overwrite=overwrite, atomic=atomic)
+    finally:
+        content_file.close()
+
+
+def save_content_to_storage(content, storage, filename, overwrite=False,
+                            atomic=False):
+    """save File instance to Django storage with filename
+
+    Attributes:
+        content -- Django File instance
+        storage -- Django storage instance
+        filename -- filename
+        overwrite -- If true, delete existing file first
+        atomic -- If true, the content is written to a temporary file and
+                  renamed to filename when the storage is a local file
+                  system thus the file is never observed half-written and
+                  the filename is never changed by the storage. Other storages
+                  fall back to overwrite.
+
+    Usage::
+        >>> from django.core.files.base import ContentFile
+        >>> from django.core.files.storage import FileSystemStorage
+        >>> storage = FileSystemStorage()
+        >>> filename = 'test.txt'
+        >>> filename_ = save_content_to_storage(ContentFile(b'a'), storage,
+        ...                                     filename)
+        >>> filename_ = save_content_to_storage(ContentFile(b'b'), storage,
+        ...                                     filename, atomic=True)
+        >>> assert filename == filename_
+        >>> assert storage.open(filename).read() == b'b'
+        >>> storage.delete(filename)
+    """
+    if atomic:
+        try:
+            path = storage.path(filename)
+        except NotImplementedError:
+            path = None
+        if path:
+            _save_atomically(content, storage, path)
+            return filename
+        overwrite = True
     if overwrite and storage.exists(filename):
         storage.delete(filename)
-    return storage.save(filename, content_file)
+    return storage.save(filename, content)
 
 
-def get_thumbnail_filename(path, name, pattern=None):
+def copy_in_storage(storage, source, filename, atomic=False):
+    """copy the file source to filename in the storage
+
+    The file is hard linked when the storage is a local file system (and
+    copied when the link is not available) thus neither the bytes are
+    transferred nor the storage usage grows. Existing filename is always
+    overwritten.
+
+    Attributes:
+        storage -- Django storage instance
+        source -- A name of the source file in the storage
+        filename -- A name of the copied file
+        atomic -- If true, replace existing file atomically (see
+                  save_content_to_storage)
+
+    Usage::
+        >>> from django.core.files.base import ContentFile
+        >>> from django.core.files.storage import FileSystemStorage
+        >>> storage = FileSystemStorage()
+        >>> source = storage.save('test.txt', ContentFile(b'a'))
+        >>> filename = copy_in_storage(storage, source, 'test.copy.txt')
+        >>> assert storage.open(filename).read() == b'a'
+        >>> storage.delete(source)
+        >>> storage.delete(filename)
+    """
+    try:
+        source_path = storage.path(source)
+        path = storage.path(filename)
+    except NotImplementedError:
+        source_path = path = None
+    if source_path:
+        if os.path.exists(path) and os.path.samefile(source_path, path):
+            # already linked
+            return filename
+        directory = os.path.dirname(path)
+        tmp = os.path.join(directory, '.thumbnailfield-%s.tmp' % (
+            uuid.uuid4().hex))
+        try:
+            _makedirs(directory)
+            os.link(source_path, tmp)
+            replace(tmp, path)
+            return filename
+        except (OSError, AttributeError):
+            # hard link is not supported (e.g. cross-device or Windows)
+            pass
+        finally:
+            # rename does nothing when both names are links of the same
+            # file (e.g. linked by another process meanwhile)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    content = storage.open(source, 'rb')
+    try:
+        return save_content_to_storage(content, storage, filename,
+                                       overwrite=True, atomic=atomic)
+    finally:
+        content.close()
+
+
+def _makedirs(directory):
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # the directory has been created by another process
+            if not os.path.isdir(directory):
+                raise
+
+
+def _save_atomically(content, storage, path):
+    directory = os.path.dirname(path)
+    _makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.thumbnailfield-',
+                               suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fo:
+            for chunk in content.chunks():
+                fo.write(chunk)
+        mode = (getattr(storage, 'file_permissions_mode', None) or
+                getattr(django_settings, 'FILE_UPLOAD_PERMISSIONS', None) or
+                0o644)
+        os.chmod(tmp, mode)
+        replace(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def get_thumbnail_filename(path, name, pattern=None, fingerprint='',
+                           ext=None):
     """get thumbnail filename with name and pattern
 
     Attributes:
@@ -76,6 +271,10 @@ def get_thumbnail_filename(path, name, pattern=None):
         name -- thumbnail name
         pattern -- file name generation pattern (default =
                    settings.THUMBNAILFIELD_FILENAME_PATTERN)
+        fingerprint -- fingerprint of the process patterns used as ``hash``
+                       (see get_pattern_fingerprint)
+        ext -- extension of the thumbnail without the dot (default = the
+               extension of path)
 
     Usage::
         >>> path = "/some/where/test.png"
@@ -83,24 +282,145 @@ def get_thumbnail_filename(path, name, pattern=None):
         >>> pattern = r"%(root)s/%(filename)s.%(name)s.%(ext)s"
         >>> thumb_filename = get_thumbnail_filename(path, name, pattern)
         >>> assert thumb_filename == "/some/where/test.small.png"
+        >>> pattern = r"%(root)s/%(filename)s.%(name)s.%(hash)s.%(ext)s"
+        >>> thumb_filename = get_thumbnail_filename(path, name, pattern,
+        ...                                         "0123abcd")
+        >>> assert thumb_filename == "/some/where/test.small.0123abcd.png"
+        >>> thumb_filename = get_thumbnail_filename(path, name, pattern,
+        ...                                         "0123abcd", "webp")
+        >>> assert thumb_filename == "/some/where/test.small.0123abcd.webp"
     """
     pattern = pattern or settings.THUMBNAILFIELD_FILENAME_PATTERN
     root, filename = os.path.split(path)
-    filename, ext = os.path.splitext(filename)
+    filename, original_ext = os.path.splitext(filename)
     path = pattern % {
         'root': root,
         'filename': filename,
         'name': name,
-        'ext': ext[1:],
+        'ext': original_ext[1:] if ext is None else ext,
+        'hash': fingerprint,
     }
     return path
 
 
-def get_fileformat_from_filename(filename):
+def get_pattern_fingerprint(patterns):
+    """get a stable fingerprint of process patterns
+
+    Attributes:
+        patterns -- Process patterns
+
+    Each pattern is normalized (the default process method and process
+    options are applied) before it is hashed thus equivalent patterns have
+    the same fingerprint.
+
+    Usage::
+        >>> from thumbnailfield.compatibility import override_settings
+        >>> a = get_pattern_fingerprint((640, 480))
+        >>> b = get_pattern_fingerprint(((640, 480, 'thumbnail'),))
+        >>> c = get_pattern_fingerprint((800, 600))
+        >>> assert a == b
+        >>> assert a != c
+        >>> assert len(a) == 8
+        >>> with override_settings(
+        ...         THUMBNAILFIELD_DEFAULT_PROCESS_METHOD='resize'):
+        ...     d = get_pattern_fingerprint((640, 480))
+        >>> assert a != d
+    """
+    if patterns is None:
+        return hashlib.md5(repr(None).encode('utf-8')).hexdigest()[:8]
+    return compile_patterns(patterns).fingerprint
+
+
+def get_storage_key(storage):
+    """get a string which identifies the storage
+
+    Usage::
+        >>> from django.core.files.storage import FileSystemStorage
+        >>> storage = FileSystemStorage(location='/tmp')
+        >>> get_storage_key(storage)
+        'django.core.files.storage.FileSystemStorage:/tmp'
+    """
+    cls = storage.__class__
+    location = getattr(storage, 'location', '')
+    return '%s.%s:%s' % (cls.__module__, cls.__name__, location)
+
+
+def get_modified_time(storage, name):
+    """get the last modified time of the file in the storage (or None)"""
+    try:
+        if hasattr(storage, 'get_modified_time'):
+            # Django >= 1.10
+            return storage.get_modified_time(name)
+        return storage.modified_time(name)
+    except (NotImplementedError, EnvironmentError):
+        return None
+
+
+# extensions which are not registered in every Pillow build (or registered
+# as a different format). These take precedence over Pillow.
+EXTENSION_FORMATS = {
+    '.bmp': 'BMP',
+    '.dib': 'BMP',
+    '.eps': 'EPS',
+    '.ps': 'EPS',
+    '.webp': 'WEBP',
+    '.avif': 'AVIF',
+    '.avifs': 'AVIF',
+    '.heic': 'HEIF',
+    '.heif': 'HEIF',
+}
+
+_extension_map = None
+
+
+def get_extension_map():
+    """get a dictionary of lower extension (with the dot) and PIL format name
+
+    The map is built once from the extensions registered in Pillow
+    (``Image.registered_extensions``), EXTENSION_FORMATS and
+    settings.THUMBNAILFIELD_EXTENSION_FORMATS (in this order, later ones
+    take precedence). It is rebuilt when the setting is changed (e.g. with
+    ``override_settings``) in Django >= 1.4.
+
+    Usage::
+        >>> extension_map = get_extension_map()
+        >>> extension_map['.jfif']
+        'JPEG'
+        >>> extension_map is get_extension_map()
+        True
+    """
+    global _extension_map
+    extension_map = _extension_map
+    if extension_map is None:
+        extension_map = dict((ext.lower(), fmt) for ext, fmt in
+                             Image.registered_extensions().items())
+        extension_map.update(EXTENSION_FORMATS)
+        extension_map.update(
+            (ext.lower(), fmt) for ext, fmt in
+            settings.THUMBNAILFIELD_EXTENSION_FORMATS.items())
+        _extension_map = extension_map
+    return extension_map
+
+
+def _reset_extension_map(sender, setting, **kwargs):
+    global _extension_map
+    if setting == 'THUMBNAILFIELD_EXTENSION_FORMATS':
+        _extension_map = None
+if setting_changed is not None:
+    setting_changed.connect(_reset_extension_map)
+
+
+def get_fileformat_from_filename(filename, fileobj=None):
     """get fileformat from filename
 
+    The format is looked up from the extension (see get_extension_map).
+    When the extension is missing or unknown, the format is sniffed from the
+    headers of fileobj (see probe.get_image_format).
+
     Attributes:
         filename -- filename used to guess fileformat
+        fileobj -- A file-like object of the encoded image used when the
+                   extension is missing or unknown
 
     Usage::
         >>> assert get_fileformat_from_filename("test.png") == "PNG"
@@ -112,49 +432,124 @@ def get_fileformat_from_filename(filename):
         >>> assert get_fileformat_from_filename("test.tiff") == "TIFF"
         >>> assert get_fileformat_from_filename("test.bmp") == "BMP"
         >>> assert get_fileformat_from_filename("test.dib") == "BMP"
+        >>> assert get_fileformat_from_filename("test.ps") == "EPS"
+        >>> assert get_fileformat_from_filename("test.webp") == "WEBP"
+        >>> assert get_fileformat_from_filename("test.avif") == "AVIF"
+        >>> assert get_fileformat_from_filename("test.heic") == "HEIF"
+        >>> assert get_fileformat_from_filename("TEST.PNG") == "PNG"
         >>> assert get_fileformat_from_filename(
         ...     "/some/where/test.png") == "PNG"
+        >>> assert get_fileformat_from_filename("test") is None
+        >>> assert get_fileformat_from_filename("ps") is None
+        >>> assert get_fileformat_from_filename("some.png/test") is None
+        >>> buf = StringIO()
+        >>> Image.new('RGB', (10, 10)).save(buf, format='PNG')
+        >>> _ = buf.seek(0)
+        >>> assert get_fileformat_from_filename("test", buf) == "PNG"
     """
-    patterns = (
-        (['.png'], 'PNG'),
-        (['.jpg', '.jpe', '.jpeg'], 'JPEG'),
-        (['.gif'], 'GIF'),
-        (['.tif', '.tiff'], 'TIFF'),
-        (['.bmp', '.dib'], 'BMP'),
-        (['.dcx'], 'DCX'),
-        (['.eps', 'ps'], 'EPS'),
-        (['.im'], 'IM'),
-        (['.pcd'], 'PCD'),
-        (['.pcx'], 'PCX'),
-        (['.pdf'], 'PDF'),
-        (['.pbm', '.pgm', '.ppm'], 'PPM'),
-        (['.psd'], 'PSD'),
-        (['.xbm'], 'XBM'),
-        (['.xpm'], 'XPM')
-    )
-    if '.' not in filename:
-        return None
-    ext = os.path.splitext(filename)[1].lower()
-    for pattern in patterns:
-        if ext in pattern[0]:
-            return pattern[1]
-    return None
-
-
-def _split_pattern(pattern):
-    process_method = None
-    process_options = settings.THUMBNAILFIELD_DEFAULT_PROCESS_OPTIONS
-    if len(pattern) == 1:
-        width = height = pattern[0]
-    if len(pattern) == 2:
-        width, height = pattern
-    elif len(pattern) == 3:
-        width, height, process_method = pattern
-    elif len(pattern) == 4:
-        width, height, process_method, process_options = pattern
-    process_method = (
-        process_method or settings.THUMBNAILFIELD_DEFAULT_PROCESS_METHOD)
-    return width, height, process_method, process_options
+    # the extension is sliced directly (os.path.splitext is much slower
+    # than the lookup itself)
+    dot = filename.rfind('.')
+    file_fmt = None
+    if dot > filename.rfind('/'):
+        file_fmt = (_extension_map or get_extension_map()).get(
+            filename[dot:].lower())
+    if file_fmt is None and fileobj is not None:
+        file_fmt = get_image_format(fileobj)
+    return file_fmt
+
+
+# extensions of output formats which differ from the lower format name
+FORMAT_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'TIFF': 'tif',
+}
+
+
+def get_format_extension(file_fmt):
+    """get extension (without the dot) of the PIL format name
+
+    Usage::
+        >>> get_format_extension('WEBP')
+        'webp'
+        >>> get_format_extension('JPEG')
+        'jpg'
+    """
+    return FORMAT_EXTENSIONS.get(file_fmt, file_fmt.lower())
+
+
+def get_format_mimetype(file_fmt):
+    """get mimetype of the PIL format name
+
+    Usage::
+        >>> get_format_mimetype('WEBP')
+        'image/webp'
+        >>> get_format_mimetype('AVIF')
+        'image/avif'
+    """
+    Image.init()
+    return Image.MIME.get(file_fmt, 'image/%s' % file_fmt.lower())
+
+
+def get_accepted_mimetypes(accept):
+    """get a set of mimetypes explicitly accepted in the Accept header
+
+    Wildcards (e.g. ``*/*`` or ``image/*``) are ignored because clients
+    which cannot decode modern formats send them as well. Mimetypes with
+    ``q=0`` are not accepted.
+
+    Attributes:
+        accept -- A value of Accept header
+
+    Usage::
+        >>> accepted = get_accepted_mimetypes(
+        ...     'image/avif;q=0, image/webp,image/apng,image/*,*/*;q=0.8')
+        >>> sorted(accepted)
+        ['image/apng', 'image/webp']
+        >>> sorted(get_accepted_mimetypes(None))
+        []
+    """
+    accepted = set()
+    for media_range in (accept or '').split(','):
+        params = media_range.split(';')
+        mimetype = params[0].strip().lower()
+        if not mimetype or '*' in mimetype:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(mimetype)
+    return accepted
+
+
+def get_pil_save_options(file_fmt, pil_save_options=None):
+    """get options of PIL image save method for the format
+
+    Default options of the format
+    (settings.THUMBNAILFIELD_FORMAT_PIL_SAVE_OPTIONS) are updated with
+    pil_save_options
+
+    Attributes:
+        file_fmt -- PIL format name
+        pil_save_options -- Options specified to the field
+
+    Usage::
+        >>> get_pil_save_options('WEBP', {'optimize': True}) == {
+        ...     'quality': 80, 'method': 4, 'optimize': True}
+        True
+        >>> get_pil_save_options('BMP')
+        {}
+    """
+    options = dict(
+        settings.THUMBNAILFIELD_FORMAT_PIL_SAVE_OPTIONS.get(file_fmt, {}))
+    options.update(pil_save_options or {})
+    return options
 
 
 def get_processed_image(f, img, patterns):
@@ -163,7 +558,7 @@ def get_processed_image(f, img, patterns):
     Attributes:
         f -- ThumbnailFieldFile instance
         img -- PIL Image instance
-        patterns -- Process patterns
+        patterns -- Process patterns (or Pipeline)
 
     pattern format is shown below::
 
@@ -184,25 +579,125 @@ def get_processed_image(f, img, patterns):
         THUMBNAILFIELD_DEFAULT_PROCESS_METHOD = 'thumbnail'
         THUMBNAILFIELD_DEFAULT_PROCESS_OPTIONS = {'filter': Image.ANTIALIAS}
     """
-    process_method_table = settings.THUMBNAILFIELD_PROCESS_METHOD_TABLE
-    if patterns is None:
+    pipeline = compile_patterns(patterns, f)
+    if pipeline is None:
         return img
-    processed = img.copy()
-    if len(patterns) > 0 and not isinstance(patterns[0], (list, tuple)):
-        patterns = [patterns]
+    return pipeline(img)
+
+
+def get_processed_size(f, img, patterns):
+    """get the size of the processed image without processing it
+
+    Attributes:
+        f -- ThumbnailFieldFile instance
+        img -- PIL Image instance
+        patterns -- Process patterns (or Pipeline)
+
+    It returns ``None`` when the patterns contain a process method which
+    does not provide ``get_size`` attribute (e.g. ``crop``) because the
+    result of such method is not a simple scaling of the original image.
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> img = Image.new('RGBA', (1000, 800))
+        >>> get_processed_size(None, img, (100, 100))
+        (100, 80)
+        >>> get_processed_size(None, img, ((640, 480, 'resize'),))
+        (640, 480)
+        >>> get_processed_size(None, img, (100, 100, 'crop',
+        ...                                {'left': 0, 'upper': 0}))
+    """
+    pipeline = compile_patterns(patterns, f)
+    if pipeline is None:
+        return img.size
+    return pipeline.get_size(img.size)
+
+
+def get_draft_size(f, img, patterns):
+    """get the smallest size of the image required to process patterns
+
+    Attributes:
+        f -- ThumbnailFieldFile instance
+        img -- PIL Image instance
+        patterns -- A list of process patterns (or Pipeline)
+
+    It returns ``None`` when any of patterns is not a simple scaling of the
+    image (see get_processed_size) because such patterns require the image
+    in the original size.
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> img = Image.new('RGB', (4000, 3000))
+        >>> get_draft_size(None, img, [(640, 480, 'resize'), (100, 100)])
+        (640, 480)
+        >>> get_draft_size(None, img, [(100, 100), None])
+    """
+    width = height = 0
     for pattern in patterns:
-        width, height, process_method, process_options = _split_pattern(
-            pattern)
-        for method_name, method in process_method_table.iteritems():
-            if process_method == method_name:
-                if getattr(method, 'error_check', None):
-                    method.error_check(
-                        f, img, width, height, **process_options)
-                process_method = method
-                break
-        if not callable(process_method):
-            raise AttributeError(
-                'process_method have to be a string name defined in '
-                'THUMBNAILFIELD_PROCESS_METHOD_TABLE or method.')
-        processed = process_method(processed, width, height, **process_options)
+        if pattern is None:
+            return None
+        size = get_processed_size(f, img, pattern)
+        if size is None:
+            return None
+        width = max(width, size[0])
+        height = max(height, size[1])
+    return width, height
+
+
+def get_processed_images(f, img, patterns):
+    """process PIL image with several named patterns at once
+
+    Attributes:
+        f -- ThumbnailFieldFile instance
+        img -- PIL Image instance
+        patterns -- A dictionary of process patterns (or Pipeline)
+
+    Patterns which only scale the image (``thumbnail``, ``resize``) are
+    processed from the largest to the smallest and each smaller image is
+    resampled from the nearest larger image already produced instead of the
+    original image. Other patterns are processed from the original image
+    with ``get_processed_image``.
+
+    Usage::
+        >>> from thumbnailfield.compatibility import Image
+        >>> img = Image.new('RGBA', (1000, 800))
+        >>> processed = get_processed_images(None, img, {
+        ...     'large': (640, 480, 'resize'),
+        ...     'small': (320, 240, 'crop', {'left': 0, 'upper': 0}),
+        ...     'tiny': (160, 120),
+        ...     None: None,
+        ... })
+        >>> processed['large'].size
+        (640, 480)
+        >>> processed['small'].size
+        (320, 240)
+        >>> processed['tiny'].size
+        (150, 120)
+        >>> assert processed[None] is img
+    """
+    processed = {}
+    scalables = []
+    for name, pattern in patterns.iteritems():
+        pipeline = compile_patterns(pattern, f)
+        size = pipeline and pipeline.get_size(img.size)
+        if size is None:
+            processed[name] = get_processed_image(f, img, pipeline)
+        else:
+            scalables.append((size, name, pipeline))
+    # the largest one is processed from the original image
+    scalables.sort(key=lambda x: x[0][0] * x[0][1], reverse=True)
+    renditions = []
+    for size, name, pipeline in scalables:
+        candidates = [r for r in renditions
+                      if r.size[0] >= size[0] and r.size[1] >= size[1]]
+        if candidates:
+            nearest = candidates[-1]
+            if nearest.size == size:
+                rendition = nearest
+            else:
+                rendition = nearest.resize(size, pipeline.resample)
+        else:
+            rendition = pipeline(img)
+        renditions.append(rendition)
+        processed[name] = rendition
     return processed
@@ -0,0 +1,191 @@
+# coding=utf-8
+"""
+Views of ThumbnailField
+
+``serve_thumbnail`` serves a thumbnail of a stored image. The thumbnail is
+generated when it does not exist yet and the response has ``ETag``,
+``Last-Modified`` and ``Cache-Control`` headers thus clients and CDNs can
+cache it (``304 Not Modified`` is returned for conditional requests).
+
+Include ``thumbnailfield.urls`` in your URLconf::
+
+    urlpatterns = patterns('',
+        url(r'^thumbnails/', include('thumbnailfield.urls')),
+    )
+
+and use ``<name>_serve_url`` of ThumbnailFieldFile in templates. The URL
+is built without touching the storage or generating the thumbnail::
+
+    <img src="{{ entry.thumbnail.small_serve_url }}">
+"""
+__author__ = 'Alisue <lambdalisue@hashnote.net>'
+import time
+import calendar
+import hashlib
+import mimetypes
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date
+from django.utils.cache import patch_cache_control
+from django.utils.cache import patch_vary_headers
+
+from thumbnailfield.conf import settings
+from thumbnailfield.fields import ThumbnailField
+from thumbnailfield.utils import get_modified_time
+from thumbnailfield.utils import get_fileformat_from_filename
+from thumbnailfield.utils import get_format_mimetype
+from thumbnailfield.compatibility import get_model
+from thumbnailfield.compatibility import StreamingHttpResponse
+from thumbnailfield.compatibility import require_safe
+from thumbnailfield.compatibility import parse_http_date_safe
+
+
+def _timestamp(dt):
+    if dt.tzinfo is not None:
+        return calendar.timegm(dt.utctimetuple())
+    # naive datetime in the local time (Django < 1.10)
+    return time.mktime(dt.timetuple())
+
+
+def get_etag(field_file, name):
+    """get ETag of the thumbnail from the source name, the last modified
+    time of the source, the pattern name and the fingerprint of the
+    patterns"""
+    modified_time = get_modified_time(field_file.storage, field_file.name)
+    key = '%s:%s:%s:%s' % (field_file.name,
+                           modified_time and modified_time.isoformat(),
+                           name, field_file._get_pattern_fingerprint(name))
+    return '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = [e.strip() for e in if_none_match.split(',')]
+        return etag in etags or '*' in etags
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return (if_modified_since is not None and last_modified is not None and
+            last_modified <= if_modified_since)
+
+
+def _get_field_file(app_label, model_name, field_name, source):
+    try:
+        model = get_model(app_label, model_name)
+    except LookupError:
+        # Django >= 1.7 raises LookupError for unknown models
+        model = None
+    if model is None:
+        raise Http404
+    fields = dict((f.name, f) for f in model._meta.fields)
+    field = fields.get(field_name)
+    if not isinstance(field, ThumbnailField):
+        raise Http404
+    # the source must be a file of the field thus arbitrary files in the
+    # storage are never served
+    instances = model._default_manager.filter(**{field_name: source})[:1]
+    if not instances:
+        raise Http404
+    return getattr(instances[0], field_name)
+
+
+def _iter_chunks(fileobj):
+    # the file is closed when the response is closed (or consumed)
+    try:
+        for chunk in fileobj.chunks():
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+@require_safe
+def serve_thumbnail(request, app_label, model_name, field_name, pattern,
+                    source):
+    """serve the thumbnail named pattern of source
+
+    The thumbnail in the best output format for Accept header of the request
+    is served when ``formats`` of the field are specified for the pattern
+    (see ThumbnailFieldFile.get_variant_name)
+
+    Attribute:
+        app_label -- An app label of the model
+        model_name -- A name of the model
+        field_name -- A name of ThumbnailField of the model
+        pattern -- A name of thumbnail patterns
+        source -- A name of the original file in the storage
+    """
+    field_file = _get_field_file(app_label, model_name, field_name, source)
+    if pattern not in field_file.patterns or pattern in (None, ''):
+        raise Http404
+    name = field_file.get_variant_name(pattern,
+                                       request.META.get('HTTP_ACCEPT'))
+    etag = get_etag(field_file, name)
+    modified_time = get_modified_time(field_file.storage, field_file.name)
+    last_modified = modified_time and int(_timestamp(modified_time))
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+    else:
+        thumbs_file = field_file._get_thumbnail_file(name)
+        if thumbs_file is None:
+            raise Http404
+        content_type = mimetypes.guess_type(thumbs_file.name)[0]
+        if content_type is None:
+            file_fmt = get_fileformat_from_filename(thumbs_file.name)
+            content_type = file_fmt and get_format_mimetype(file_fmt)
+        content_type = content_type or 'application/octet-stream'
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type)
+        else:
+            fileobj = field_file.storage.open(thumbs_file.name, 'rb')
+            response = StreamingHttpResponse(_iter_chunks(fileobj),
+                                             content_type=content_type)
+        response['Content-Length'] = thumbs_file.size
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True,
+                        max_age=settings.THUMBNAILFIELD_SERVE_MAX_AGE)
+    if field_file.field.variants.get(pattern):
+        patch_vary_headers(response, ('Accept',))
+    return response
+
+
+@require_safe
+def serve_rendition(request, token):
+    """serve the signed ad-hoc rendition of token
+
+    The rendition is rendered with the source and the process signed in
+    the token (see renditions.get_rendition_url) and kept in the rendition
+    store (settings.THUMBNAILFIELD_RENDITION_STORE)
+
+    Attribute:
+        token -- A signed token of the rendition
+    """
+    # django.core.signing is available in Django >= 1.4
+    from django.core import signing
+    from thumbnailfield.renditions import load_rendition_token
+    from thumbnailfield.renditions import get_rendition_key
+    from thumbnailfield.renditions import render_rendition
+    try:
+        field, source, process = load_rendition_token(token)
+    except (signing.BadSignature, LookupError):
+        raise Http404
+    if not field.storage.exists(source):
+        raise Http404
+    key = get_rendition_key(field, source, process)
+    etag = '"%s"' % key
+    if _not_modified(request, etag, None):
+        response = HttpResponseNotModified()
+    else:
+        data = render_rendition(field, source, process, key=key)
+        content_type = mimetypes.guess_type(source)[0]
+        content_type = content_type or 'application/octet-stream'
+        response = HttpResponse(content_type=content_type)
+        if request.method != 'HEAD':
+            response.write(data)
+        response['Content-Length'] = len(data)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True,
+                        max_age=settings.THUMBNAILFIELD_SERVE_MAX_AGE)
+    return response
@@ -104,3 +104,8 @@ if django.VERSION <= (1, 3):
 
 if django.VERSION >= (1, 6):
     TEST_RUNNER = 'django.test.runner.DiscoverRunner'
+
+if django.VERSION >= (1, 7):
+    # the test models share the app label of thumbnailfield thus the tables
+    # are created without the migrations of thumbnailfield
+    MIGRATION_MODULES = {'thumbnailfield': 'thumbnailfield.tests.nomigrations'}